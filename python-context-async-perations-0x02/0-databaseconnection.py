@@ -1,28 +1,95 @@
 #!/usr/bin/env python3
+import pathlib
 import sqlite3
+import threading
+
+
+def _connect(db_name, read_only):
+    # Read-only blocks get a mode=ro URI connection SQLite refuses to write through;
+    # writable ones switch the file to WAL so readers and the writer stop blocking each other
+    if read_only:
+        return sqlite3.connect(pathlib.Path(db_name).resolve().as_uri() + '?mode=ro', uri=True)
+    connection = sqlite3.connect(db_name)
+    connection.execute("PRAGMA journal_mode = WAL")
+    return connection
+
 
 class DatabaseConnection:
-    def __init__(self, db_name):
+    """
+    Context manager yielding a cursor on db_name.
+
+    The connection is opened on the first __enter__ of a thread and shared by
+    every nested block on the same database in that thread; nested blocks run
+    inside SAVEPOINTs so they can fail without undoing the outer block. The
+    outermost block commits on success and rolls back on error, and
+    read_only blocks never commit: a read_only block nested in a writable one
+    rolls back to its savepoint on the way out too. A writable block cannot nest inside a
+    read_only one, since its writes would be rolled back with the outer block.
+    """
+
+    _local = threading.local()
+
+    def __init__(self, db_name, read_only=False):
         self.db_name = db_name
+        self.read_only = read_only
         self.connection = None
         self.cursor = None
+        self._savepoint = None
+
+    @classmethod
+    def _states(cls):
+        states = getattr(cls._local, 'states', None)
+        if states is None:
+            states = cls._local.states = {}
+        return states
 
     def __enter__(self):
-        self.connection = sqlite3.connect(self.db_name)
+        states = self._states()
+        state = states.get(self.db_name)
+        if state is None:
+            state = states[self.db_name] = {'connection': _connect(self.db_name, self.read_only),
+                                            'depth': 0, 'read_only': self.read_only}
+        elif state['read_only'] and not self.read_only:
+            raise sqlite3.ProgrammingError(
+                f"writable DatabaseConnection nested in a read-only one on {self.db_name}")
+        state['depth'] += 1
+        self.connection = state['connection']
+        if state['depth'] > 1:
+            # Make sure the savepoint nests in the outer transaction instead of starting its own
+            if not self.connection.in_transaction:
+                self.connection.execute("BEGIN")
+            self._savepoint = f"nested_{state['depth']}"
+            self.connection.execute(f"SAVEPOINT {self._savepoint}")
         self.cursor = self.connection.cursor()
         return self.cursor
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.connection:
-            self.connection.commit()
-            self.connection.close()
+        states = self._states()
+        state = states[self.db_name]
+        try:
+            self.cursor.close()
+            if self._savepoint is not None:
+                # The shared connection is writable, so undo anything a read_only block wrote
+                if exc_type is not None or self.read_only:
+                    self.connection.execute(f"ROLLBACK TO {self._savepoint}")
+                self.connection.execute(f"RELEASE {self._savepoint}")
+            elif exc_type is None and not self.read_only:
+                self.connection.commit()
+            else:
+                self.connection.rollback()
+        finally:
+            state['depth'] -= 1
+            if state['depth'] == 0:
+                del states[self.db_name]
+                self.connection.close()
+            self._savepoint = None
+        return False
 
 # Example usage
 if __name__ == "__main__":
     db_file = "users.db"  # Make sure this database and table exist
-    with DatabaseConnection(db_file) as cursor:
+    with DatabaseConnection(db_file, read_only=True) as cursor:
         cursor.execute("SELECT * FROM users")
         rows = cursor.fetchall()
         for row in rows:
             print(row)
-
@@ -1,26 +1,173 @@
 # 1-execute.py
 
+import re
+import pathlib
 import sqlite3
+from collections import namedtuple
+
+_READ = re.compile(r'^\s*(?:SELECT|WITH)\b', re.IGNORECASE)
+# SELECT ... FROM table [alias] WHERE column <op> ?  -- the shape answered with one join per chunk
+_SINGLE_COMPARISON = re.compile(
+    r'^\s*SELECT\s+(?P<columns>.+?)\s+FROM\s+(?P<table>\w+)'
+    r'(?:\s+(?:AS\s+)?(?!WHERE\b)(?P<alias>\w+))?'
+    r'\s+WHERE\s+(?P<column>[\w.]+)\s*(?P<op>==|=|!=|<>|<=|>=|<|>)\s*\?\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL)
+# Only plain columns keep one output row per matching input row once joined; aggregates,
+# DISTINCT, window functions and expressions would collapse or reshape the batch
+_PLAIN_COLUMN = re.compile(
+    r'^(?:(?P<source>[A-Za-z_]\w*)\.)?(?P<name>[A-Za-z_]\w*|\*)(?P<alias>\s+(?:AS\s+)?[A-Za-z_]\w*)?$',
+    re.IGNORECASE)
+
+
+def _connect(db_file, read_only):
+    # Reads go through a mode=ro URI connection, writes through a WAL one
+    if read_only:
+        return sqlite3.connect(pathlib.Path(db_file).resolve().as_uri() + '?mode=ro', uri=True)
+    connection = sqlite3.connect(db_file)
+    connection.execute("PRAGMA journal_mode = WAL")
+    return connection
+
+
+def _row_factory(description):
+    """Slotted namedtuple class named after the result columns."""
+    fields = [column[0] for column in description]
+    return namedtuple('Row', fields, rename=True)._make
+
 
 class ExecuteQuery:
-    def __init__(self, db_file, query, params=None):
+    """
+    Runs query on db_file and returns its results from __enter__.
+
+    By default every row is fetched up front. With stream=True __enter__
+    returns an iterator that fetches arraysize rows at a time, so memory stays
+    flat however many rows match; it must be consumed inside the with block,
+    since the connection is closed on exit. row_type maps each row: pass a
+    callable taking the column values, or True for a namedtuple built from the
+    column names.
+
+    With batch=[params, ...] the statement runs once per parameter set on a
+    single connection in a single transaction. Writes go through executemany
+    and return the total row count. Reads return one list of rows per
+    parameter set: a `SELECT columns FROM table WHERE column <op> ?` query
+    selecting plain columns is answered by staging the parameters in a temp
+    table and joining against it, chunk_size sets at a time; other reads,
+    aggregates and DISTINCT included, reuse one prepared statement.
+
+    SELECT and WITH queries run on a read-only connection, everything else on
+    a connection that has switched the database to WAL.
+    """
+
+    def __init__(self, db_file, query, params=None, stream=False, arraysize=500, row_type=None,
+                 batch=None, chunk_size=5000):
         self.db_file = db_file
         self.query = query
         self.params = params or []
+        self.batch = batch
+        self.chunk_size = chunk_size
+        self.stream = stream
+        self.arraysize = arraysize
+        self.row_type = row_type
         self.connection = None
         self.cursor = None
         self.results = None
 
+    def _rows(self):
+        make_row = None
+        if self.row_type is True:
+            make_row = _row_factory(self.cursor.description)
+        elif self.row_type is not None:
+            make_row = lambda row: self.row_type(*row)
+        while True:
+            rows = self.cursor.fetchmany(self.arraysize)
+            if not rows:
+                return
+            if make_row is None:
+                yield from rows
+            else:
+                yield from map(make_row, rows)
+
+    @staticmethod
+    def _plain_columns(columns, source):
+        """columns qualified with source, or None unless every one is a plain column."""
+        qualified = []
+        for part in columns.split(','):
+            column = _PLAIN_COLUMN.match(part.strip())
+            if column is None or column.group('name').upper() in ('DISTINCT', 'ALL'):
+                return None
+            # Qualified so a column named like the staging table's cannot become ambiguous
+            qualified.append(f"{column.group('source') or source}.{column.group('name')}"
+                             f"{column.group('alias') or ''}")
+        return ', '.join(qualified)
+
+    def _joined_read(self, match, columns):
+        table, alias = match.group('table'), match.group('alias')
+        source = alias or table
+        column = match.group('column')
+        if '.' not in column:
+            column = f"{source}.{column}"
+        sql = (f"SELECT _batch._batch_index, {columns} FROM {table}{' AS ' + alias if alias else ''} "
+               f"JOIN temp._batch_params AS _batch ON {column} {match.group('op')} _batch._batch_value "
+               f"ORDER BY _batch._batch_index")
+        batch = list(self.batch)
+        groups = [[] for _ in batch]
+        description = None
+        self.cursor.execute("CREATE TEMP TABLE IF NOT EXISTS _batch_params "
+                            "(_batch_index INTEGER PRIMARY KEY, _batch_value)")
+        for start in range(0, len(batch), self.chunk_size):
+            self.cursor.execute("DELETE FROM temp._batch_params")
+            self.cursor.executemany(
+                "INSERT INTO temp._batch_params (_batch_index, _batch_value) VALUES (?, ?)",
+                ((start + offset, params[0])
+                 for offset, params in enumerate(batch[start:start + self.chunk_size])))
+            self.cursor.execute(sql)
+            description = self.cursor.description[1:]
+            for row in self.cursor:
+                groups[row[0]].append(row[1:])
+        self.cursor.execute("DROP TABLE temp._batch_params")
+        return groups, description
+
+    def _run_batch(self):
+        # One transaction for the whole batch; __exit__ commits or rolls back
+        self.connection.execute("BEGIN")
+        if not _READ.match(self.query):
+            self.cursor.executemany(self.query, self.batch)
+            return self.cursor.rowcount
+        match = _SINGLE_COMPARISON.match(self.query)
+        columns = None
+        if match and self.query.count('?') == 1:
+            columns = self._plain_columns(match.group('columns'), match.group('alias') or match.group('table'))
+        if columns is not None:
+            groups, description = self._joined_read(match, columns)
+        else:
+            groups = [self.cursor.execute(self.query, params).fetchall() for params in self.batch]
+            description = self.cursor.description
+        if self.row_type is None or description is None:
+            return groups
+        make_row = (_row_factory(description) if self.row_type is True
+                    else lambda row: self.row_type(*row))
+        return [[make_row(row) for row in rows] for rows in groups]
+
     def __enter__(self):
-        self.connection = sqlite3.connect(self.db_file)
+        self.connection = _connect(self.db_file, read_only=bool(_READ.match(self.query)))
         self.cursor = self.connection.cursor()
+        if self.batch is not None:
+            self.results = self._run_batch()
+            return self.results
         self.cursor.execute(self.query, self.params)
-        self.results = self.cursor.fetchall()
+        if self.stream:
+            self.results = self._rows()
+        elif self.row_type is not None:
+            self.results = list(self._rows())
+        else:
+            self.results = self.cursor.fetchall()
         return self.results
 
     def __exit__(self, exc_type, exc_value, traceback):
         if self.connection:
-            self.connection.commit()
+            if exc_type is not None:
+                self.connection.rollback()
+            elif not self.stream:
+                self.connection.commit()
             self.connection.close()
 
 # Usage Example
@@ -32,3 +179,13 @@ if __name__ == "__main__":
     with ExecuteQuery(db_path, query, params) as results:
         for row in results:
             print(row)
+
+    # Same query, streamed in chunks as named rows
+    with ExecuteQuery(db_path, query, params, stream=True, row_type=True) as rows:
+        for row in rows:
+            print(row.id, row.name, row.age)
+
+    # Several parameter sets on one connection, rows grouped per set
+    with ExecuteQuery(db_path, query, batch=[(25,), (40,), (60,)]) as groups:
+        for (age,), rows in zip([(25,), (40,), (60,)], groups):
+            print(f"{len(rows)} users older than {age}")
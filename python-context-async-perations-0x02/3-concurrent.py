@@ -1,33 +1,38 @@
 # 2-concurrent_queries.py
 
 import asyncio
-import aiosqlite
 
-DB_PATH = "users.db"
+query_scheduler = __import__('4-query_scheduler')
+
+DB_PATH = query_scheduler.DB_PATH
+
+# Shared by the fetchers so concurrent requests can reuse each other's rows
+scheduler = query_scheduler.QueryScheduler(DB_PATH)
 
 async def async_fetch_users():
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT * FROM users") as cursor:
-            users = await cursor.fetchall()
-            print("All users:")
-            for user in users:
-                print(user)
-            return users
+    users = await scheduler.fetch("SELECT * FROM users")
+    print("All users:")
+    for user in users:
+        print(user)
+    return users
 
 async def async_fetch_older_users():
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT * FROM users WHERE age > 40") as cursor:
-            older_users = await cursor.fetchall()
-            print("\nUsers older than 40:")
-            for user in older_users:
-                print(user)
-            return older_users
+    # Answered from the rows of SELECT * FROM users when both run together
+    older_users = await scheduler.fetch("SELECT * FROM users WHERE age > ?", (40,))
+    print("\nUsers older than 40:")
+    for user in older_users:
+        print(user)
+    return older_users
 
 async def fetch_concurrently():
-    await asyncio.gather(
-        async_fetch_users(),
-        async_fetch_older_users()
-    )
+    try:
+        return await asyncio.gather(
+            async_fetch_users(),
+            async_fetch_older_users()
+        )
+    finally:
+        print(scheduler.stats())
+        await scheduler.close()
 
 if __name__ == "__main__":
     asyncio.run(fetch_concurrently())
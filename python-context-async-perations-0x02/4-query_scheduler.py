@@ -0,0 +1,336 @@
+# 4-query_scheduler.py
+
+import re
+import asyncio
+import pathlib
+import operator
+import contextlib
+import aiosqlite
+
+DB_PATH = "users.db"
+
+# SELECT * FROM table [WHERE a AND b ...] -- the only shape whose rows can answer other queries
+_SELECT_ALL = re.compile(
+    r'^\s*SELECT\s+\*\s+FROM\s+(?P<table>\w+)(?:\s+WHERE\s+(?P<where>.+?))?\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL)
+_PREDICATE = re.compile(
+    r"^\s*(?P<column>\w+)\s*(?P<op>==|=|!=|<>|<=|>=|<|>)\s*"
+    r"(?P<value>\?|-?\d+(?:\.\d+)?|'(?:[^']|'')*')\s*$",
+    re.DOTALL)
+_AND = re.compile(r'\s+AND\s+', re.IGNORECASE)
+# String literals and quoted identifiers, whose whitespace is significant
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+_WHITESPACE = re.compile(r'\s+')
+_COLUMN_NAME = re.compile(r'\s*(?:"((?:[^"]|"")*)"|`([^`]*)`|\[([^\]]*)\]|(\w+))')
+_COLLATE = re.compile(r'\bCOLLATE\s+"?(\w+)', re.IGNORECASE)
+_CONSTRAINT = re.compile(r'(?:CONSTRAINT|PRIMARY|UNIQUE|CHECK|FOREIGN)$', re.IGNORECASE)
+
+_OPERATORS = {'=': operator.eq, '!=': operator.ne, '<': operator.lt,
+              '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+_ALIASES = {'==': '=', '<>': '!='}
+_MISSING = object()
+
+
+class _Unsupported(Exception):
+    """A row cannot be filtered in Python the way SQLite would filter it."""
+
+
+def _literal(token, params):
+    if token == '?':
+        return next(params)
+    if token.startswith("'"):
+        return token[1:-1].replace("''", "'")
+    return float(token) if '.' in token else int(token)
+
+
+def parse(query, params=()):
+    """
+    (table, frozenset of (column, op, value)) for `SELECT * FROM table
+    WHERE column <op> value AND ...`, or None for any other query.
+    """
+    match = _SELECT_ALL.match(query)
+    if match is None:
+        return None
+    params = iter(params)
+    predicates = set()
+    if match.group('where'):
+        for part in _AND.split(match.group('where')):
+            predicate = _PREDICATE.match(part)
+            if predicate is None:
+                return None
+            op = predicate.group('op')
+            try:
+                value = _literal(predicate.group('value'), params)
+            except StopIteration:
+                return None
+            predicates.add((predicate.group('column').lower(), _ALIASES.get(op, op), value))
+    if next(params, _MISSING) is not _MISSING:
+        return None
+    return match.group('table').lower(), frozenset(predicates)
+
+
+def _normalize(query):
+    """query with runs of whitespace collapsed everywhere except inside quotes."""
+    parts = _QUOTED.split(query)
+    # split() with a capturing group puts the quoted parts at the odd indexes
+    return ''.join(part if index % 2 else _WHITESPACE.sub(' ', part)
+                   for index, part in enumerate(parts)).strip()
+
+
+def _number(value):
+    return isinstance(value, (int, float))
+
+
+def _implies(predicates, required):
+    """Whether every row satisfying all of predicates also satisfies required."""
+    if required in predicates:
+        return True
+    column, op, bound = required
+    if op not in ('<', '<=', '>', '>=') or not _number(bound):
+        return False
+    for other_column, other_op, value in predicates:
+        if other_column != column or not _number(value) or other_op not in ('=', op[0], op[0] + '='):
+            continue
+        if op[0] == '>' and (value > bound or value == bound and (op == '>=' or other_op == '>')):
+            return True
+        if op[0] == '<' and (value < bound or value == bound and (op == '<=' or other_op == '<')):
+            return True
+    return False
+
+
+def _covers(superset, subset):
+    """Whether every row of the parsed query subset is also a row of superset."""
+    return (superset[0] == subset[0]
+            and all(_implies(subset[1], required) for required in superset[1]))
+
+
+def _definitions(sql):
+    """The comma-separated parts of the outer parentheses of a CREATE TABLE."""
+    parts, depth, quote, start = [], 0, None, None
+    for index, char in enumerate(sql):
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in '\'"`':
+            quote = char
+        elif char == '[':
+            quote = ']'
+        elif char == '(':
+            depth += 1
+            if depth == 1:
+                start = index + 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                parts.append(sql[start:index])
+                break
+        elif char == ',' and depth == 1:
+            parts.append(sql[start:index])
+            start = index + 1
+    return parts
+
+
+def _column_collations(sql):
+    """{column: collation} declared by a CREATE TABLE statement, BINARY by default."""
+    collations = {}
+    for definition in _definitions(sql):
+        match = _COLUMN_NAME.match(definition)
+        if match is None:
+            continue
+        name = next(group for group in match.groups() if group is not None)
+        if match.group(4) is not None and _CONSTRAINT.match(name):
+            continue  # a table constraint, not a column
+        collation = _COLLATE.search(definition, match.end())
+        collations[name.lower()] = collation.group(1).upper() if collation else 'BINARY'
+    return collations
+
+
+def _matches(value, op, target):
+    if value is None:
+        return False  # NULL never satisfies a comparison
+    if _number(value) and _number(target) or isinstance(value, str) and isinstance(target, str):
+        return _OPERATORS[op](value, target)
+    raise _Unsupported(f"cannot compare {value!r} with {target!r} like SQLite does")
+
+
+def _filter(rows, columns, predicates, collations):
+    try:
+        checks = [(columns.index(column), op, value) for column, op, value in predicates]
+    except ValueError:
+        raise _Unsupported("condition on a column the superset does not return") from None
+    for column, _, value in predicates:
+        # Python compares strings byte by byte, which only BINARY columns do as well
+        if isinstance(value, str) and collations.get(column) != 'BINARY':
+            raise _Unsupported(f"{column} does not compare strings with BINARY collation")
+    return [row for row in rows
+            if all(_matches(row[index], op, value) for index, op, value in checks)]
+
+
+class _Execution:
+    """One query actually sent to the database and the requests it answers."""
+
+    def __init__(self, key, parsed):
+        self.key = key
+        self.parsed = parsed
+        # (future, query, params, predicates to apply in memory or None for the rows as they are)
+        self.waiters = []
+
+
+class QueryScheduler:
+    """
+    Runs read queries on a bounded pool of aiosqlite connections while
+    answering as many of them as possible from queries already in flight.
+
+    Requests made in the same event loop iteration are planned together,
+    broadest first. A request identical to a running query waits for its
+    rows. A `SELECT * FROM table WHERE ...` request whose rows are a subset
+    of a running `SELECT * FROM table ...` (its conditions imply the running
+    query's) is answered by filtering the superset's rows in memory. Rows the
+    in-memory filter cannot judge like SQLite would (mixed types) send the
+    request to the database after all, and so do string conditions on columns
+    not declared with the default BINARY collation (NOCASE, RTRIM, ...), which
+    are read from sqlite_master. Only reads may be scheduled.
+    """
+
+    def __init__(self, db_path=DB_PATH, size=4):
+        self.db_path = db_path
+        self.size = size
+        self.executed = 0
+        self.coalesced = 0
+        self.subsumed = 0
+        self._idle = []
+        self._opened = []
+        self._slots = None
+        self._pending = []
+        self._running = {}
+        self._tasks = set()
+
+    @contextlib.asynccontextmanager
+    async def _connection(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        async with self._slots:
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                # Only reads are scheduled, so SQLite may as well enforce it
+                conn = await aiosqlite.connect(
+                    pathlib.Path(self.db_path).resolve().as_uri() + '?mode=ro', uri=True)
+                self._opened.append(conn)
+            try:
+                yield conn
+            finally:
+                self._idle.append(conn)
+
+    async def fetch(self, query, params=()):
+        """Rows of query, possibly shared with or derived from other requests."""
+        future = asyncio.get_running_loop().create_future()
+        if not self._pending:
+            asyncio.get_running_loop().call_soon(self._dispatch)
+        self._pending.append((query, tuple(params), future))
+        return await future
+
+    def _superset_of(self, parsed):
+        best = None
+        for execution in self._running.values():
+            if execution.parsed is not None and _covers(execution.parsed, parsed):
+                if best is None or len(execution.parsed[1]) > len(best.parsed[1]):
+                    best = execution
+        return best
+
+    def _dispatch(self):
+        pending, self._pending = self._pending, []
+        planned = [(query, params, future, parse(query, params))
+                   for query, params, future in pending if not future.done()]
+        # Whatever covers a query also covers every query it covers, so ordering by how many
+        # pending queries cover each one starts the broad ones before those riding on them
+        covered_by = [0 if item[3] is None else sum(
+            other is not item and other[3] is not None and _covers(other[3], item[3])
+            for other in planned) for item in planned]
+        planned = [item for _, item in sorted(zip(covered_by, planned), key=lambda pair: pair[0])]
+        for query, params, future, parsed in planned:
+            key = (_normalize(query), params)
+            execution = self._running.get(key)
+            if execution is not None:
+                self.coalesced += 1
+                execution.waiters.append((future, query, params, None))
+                continue
+            if parsed is not None:
+                execution = self._superset_of(parsed)
+                if execution is not None:
+                    self.subsumed += 1
+                    execution.waiters.append((future, query, params, parsed[1]))
+                    continue
+            execution = self._running[key] = _Execution(key, parsed)
+            execution.waiters.append((future, query, params, None))
+            self._spawn(self._execute(execution, query, params))
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, query, params):
+        self.executed += 1
+        async with self._connection() as db:
+            async with db.execute(query, params) as cursor:
+                rows = await cursor.fetchall()
+                return [column[0].lower() for column in cursor.description], rows
+
+    async def _execute(self, execution, query, params):
+        try:
+            columns, rows = await self._run(query, params)
+        except Exception as error:
+            for future, *_ in execution.waiters:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            # Later requests must start their own query instead of joining a finished one
+            del self._running[execution.key]
+        collations = {}
+        if any(predicates and any(isinstance(value, str) for *_, value in predicates)
+               for *_, predicates in execution.waiters):
+            collations = await self._collations(execution.parsed[0])
+        for future, query, params, predicates in execution.waiters:
+            if future.done():
+                continue  # the caller was cancelled
+            if predicates is None:
+                future.set_result(list(rows))
+                continue
+            try:
+                future.set_result(_filter(rows, columns, predicates, collations))
+            except _Unsupported:
+                self.subsumed -= 1
+                self._spawn(self._execute_alone(future, query, params))
+
+    async def _collations(self, table):
+        # Read on every use rather than cached, so a schema change is never missed
+        try:
+            async with self._connection() as db:
+                async with db.execute("SELECT sql FROM sqlite_master WHERE type = 'table' "
+                                      "AND name = ? COLLATE NOCASE", (table,)) as cursor:
+                    row = await cursor.fetchone()
+        except Exception:
+            return {}  # unknown collations: string conditions go to the database
+        return _column_collations(row[0]) if row is not None and row[0] else {}
+
+    async def _execute_alone(self, future, query, params):
+        try:
+            _, rows = await self._run(query, params)
+        except Exception as error:
+            if not future.done():
+                future.set_exception(error)
+        else:
+            if not future.done():
+                future.set_result(rows)
+
+    def stats(self):
+        return {'executed': self.executed, 'coalesced': self.coalesced,
+                'subsumed': self.subsumed, 'connections': len(self._opened)}
+
+    async def close(self):
+        for conn in self._opened:
+            await conn.close()
+        self._opened.clear()
+        self._idle.clear()
@@ -0,0 +1,145 @@
+import os
+import time
+import atexit
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+connection_pool = __import__('6-connection_pool')
+bounded_cache = __import__('7-bounded_cache')
+
+# Bump when the snapshot layout changes; older files are ignored on restore
+SNAPSHOT_FORMAT = 1
+
+
+def database_version(pool=None):
+    """
+    SQLite schema cookie of the database; it changes whenever the schema does.
+    Data writes leave it alone, which is why restore() caps restored TTLs.
+    """
+    with (pool or connection_pool.get_default_pool()).connection() as conn:
+        return conn.execute("PRAGMA schema_version").fetchone()[0]
+
+
+def _check_listable(cache):
+    if not hasattr(cache, 'hottest'):
+        raise TypeError(f"{type(cache).__name__} cannot list its entries to snapshot them")
+
+
+def snapshot(cache, path, top_n=256, version=None):
+    """
+    Write the top_n most hit entries of cache to path and return their count.
+
+    Remaining TTLs are stored as wall-clock deadlines so they keep counting
+    down while the worker is stopped. The file is replaced atomically. cache
+    must list its entries with hottest(), as QueryCache does; a
+    SharedQueryCache already persists in its own file and cannot.
+    """
+    _check_listable(cache)
+    now = time.time()
+    entries = [(key, value, tables, None if remaining is None else now + remaining)
+               for key, value, tables, remaining, _ in cache.hottest(top_n)]
+    data = {
+        'format': SNAPSHOT_FORMAT,
+        'version': version,
+        'created': now,
+        'entries': entries,
+    }
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as file:
+        pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+    return len(entries)
+
+
+def restore(cache, path, version=None, max_age=None, ttl=60.0):
+    """
+    Load a snapshot into cache and return the number of entries restored.
+
+    Nothing is restored when the file is missing, has another format, was taken
+    against another database version, or is older than max_age seconds;
+    entries whose TTL ran out since the snapshot are dropped. Rows written by
+    other workers while this one was down never reached its invalidation, so
+    every restored entry expires after at most ttl seconds, including those
+    that had no TTL of their own.
+    """
+    if ttl is None or ttl <= 0:
+        raise ValueError("restored entries need a positive ttl")
+    try:
+        with open(path, 'rb') as file:
+            data = pickle.load(file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        return 0
+    now = time.time()
+    if data.get('format') != SNAPSHOT_FORMAT or data.get('version') != version:
+        return 0
+    if max_age is not None and now - data['created'] > max_age:
+        return 0
+    restored = 0
+    # Oldest-first so the hottest entries end up most recently used
+    for key, value, tables, deadline in reversed(data['entries']):
+        if deadline is not None and deadline <= now:
+            continue
+        remaining = ttl if deadline is None else min(ttl, deadline - now)
+        if cache.put(key, value, tables, ttl=remaining):
+            restored += 1
+    return restored
+
+
+class PeriodicSnapshot:
+    """Snapshot a cache every interval seconds and once more at shutdown."""
+
+    def __init__(self, cache, path, interval=300, top_n=256, version=None):
+        _check_listable(cache)
+        self.cache = cache
+        self.path = path
+        self.interval = interval
+        self.top_n = top_n
+        self.version = version
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='cache-snapshot', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            snapshot(self.cache, self.path, self.top_n, self.version)
+
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join()
+        snapshot(self.cache, self.path, self.top_n, self.version)
+
+
+def warm_up(fetch, queries, workers=4):
+    """
+    Run every (query, params) pair through a cache_query decorated fetch in
+    parallel before the worker takes traffic. Returns the pairs that failed
+    together with their exception.
+    """
+    def run(item):
+        query, params = item
+        try:
+            fetch(query=query, params=params)
+        except Exception as error:
+            return item, error
+        return None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [failure for failure in executor.map(run, queries) if failure is not None]
+
+
+if __name__ == "__main__":
+    cache = bounded_cache.query_cache
+    version = database_version()
+    restored = restore(cache, 'query_cache.snapshot', version=version, max_age=3600)
+    failures = warm_up(bounded_cache.fetch_users_with_cache, [
+        ("SELECT * FROM users", ()),
+        ("SELECT * FROM users WHERE age > ?", (25,)),
+        ("SELECT * FROM users WHERE age > ?", (40,)),
+    ])
+    print(f"restored {restored} entries, warm-up failures: {failures}")
+    print(cache.stats())
+    PeriodicSnapshot(cache, 'query_cache.snapshot', version=version)
@@ -0,0 +1,175 @@
+import time
+import random
+import sqlite3
+import functools
+import threading
+
+with_db_connection = __import__('6-connection_pool').with_db_connection
+
+# sqlite3 messages that describe contention, not a broken query
+TRANSIENT_MESSAGES = ('database is locked', 'database table is locked', 'database is busy',
+                      'disk i/o error', 'unable to open database file')
+
+
+def is_transient(error):
+    """
+    True for errors worth retrying. An exception can decide for itself by
+    carrying a boolean `retryable` attribute; otherwise only sqlite3
+    OperationalErrors about locking/busy/IO are retried.
+    """
+    retryable = getattr(error, 'retryable', None)
+    if retryable is not None:
+        return retryable
+    if isinstance(error, sqlite3.OperationalError):
+        message = str(error).lower()
+        return any(text in message for text in TRANSIENT_MESSAGES)
+    return False
+
+
+class RetryBudget:
+    """
+    Process-wide token bucket limiting retries to a fraction of calls.
+
+    Every first attempt deposits `ratio` tokens and every retry withdraws one,
+    so during an outage retries stop instead of multiplying the load.
+    """
+
+    def __init__(self, ratio=0.2, min_tokens=10, max_tokens=100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = float(min_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryMetrics:
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.successes = 0
+        self.failures = 0
+        self.not_retryable = 0
+        self.budget_exhausted = 0
+        self.deadline_exhausted = 0
+        self.sleep_time = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: value for name, value in vars(self).items() if not name.startswith('_')}
+
+
+retry_budget = RetryBudget()
+retry_metrics = RetryMetrics()
+
+
+class RetryPolicy:
+    """
+    The retry decisions shared by every retrying wrapper, sync or async.
+
+    A wrapper calls start() once per call, pause() after each failed attempt
+    and sleeps for the returned seconds, or re-raises when it returns None,
+    and succeeded() once an attempt returns. Every outcome is recorded in
+    metrics with the reason the call gave up.
+    """
+
+    def __init__(self, retries=3, base_delay=0.05, max_delay=2.0, max_total_delay=5.0,
+                 retry_on=is_transient, budget=None, metrics=None):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_total_delay = max_total_delay
+        self.retry_on = retry_on
+        self.budget = budget or retry_budget
+        self.metrics = metrics or retry_metrics
+
+    def start(self):
+        self.budget.deposit()
+
+    def pause(self, error, attempt, slept):
+        """Seconds to sleep before retrying after attempt failed, None to give up."""
+        metrics = self.metrics
+        if not self.retry_on(error):
+            metrics.add(calls=1, attempts=attempt + 1, failures=1, not_retryable=1)
+            return None
+        if attempt >= self.retries:
+            metrics.add(calls=1, attempts=attempt + 1, failures=1)
+            return None
+        pause = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if slept + pause > self.max_total_delay:
+            metrics.add(calls=1, attempts=attempt + 1, failures=1, deadline_exhausted=1)
+            return None
+        if not self.budget.withdraw():
+            metrics.add(calls=1, attempts=attempt + 1, failures=1, budget_exhausted=1)
+            return None
+        metrics.add(retries=1, sleep_time=pause)
+        return pause
+
+    def succeeded(self, attempt):
+        self.metrics.add(calls=1, attempts=attempt + 1, successes=1)
+
+
+def retry_on_failure(retries=3, base_delay=0.05, max_delay=2.0, max_total_delay=5.0,
+                     retry_on=is_transient, budget=None, metrics=None):
+    """
+    Retry transient failures with exponential backoff and full jitter.
+
+    Attempt n sleeps a random time between 0 and min(max_delay,
+    base_delay * 2 ** n), so callers that failed together spread out instead
+    of colliding again. Retrying stops when retry_on(error) is false, when the
+    total sleep would exceed max_total_delay or when the retry budget is empty.
+    """
+    policy = RetryPolicy(retries, base_delay, max_delay, max_total_delay, retry_on, budget, metrics)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            policy.start()
+            slept = 0.0
+            attempt = 0
+            while True:
+                try:
+                    result = func(*args, **kwargs)
+                except Exception as error:
+                    pause = policy.pause(error, attempt, slept)
+                    if pause is None:
+                        raise
+                    time.sleep(pause)
+                    slept += pause
+                    attempt += 1
+                    continue
+                policy.succeeded(attempt)
+                return result
+        return wrapper
+    return decorator
+
+
+@with_db_connection
+@retry_on_failure(retries=3, base_delay=0.1)
+def fetch_users_with_retry(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users")
+    return cursor.fetchall()
+
+
+# Attempt to fetch users, retrying only if the database is locked or busy
+if __name__ == "__main__":
+    users = fetch_users_with_retry()
+    print(users)
+    print(retry_metrics.snapshot())
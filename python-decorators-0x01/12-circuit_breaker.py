@@ -0,0 +1,172 @@
+import time
+import sqlite3
+import functools
+import threading
+from collections import deque
+
+connection_pool = __import__('6-connection_pool')
+retry_backoff = __import__('11-retry_backoff')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised without touching the database while the circuit is open."""
+
+    # An open circuit is a decision, not contention: retry_on_failure must not retry it
+    retryable = False
+
+
+def is_database_failure(error):
+    # IntegrityError, ProgrammingError and friends are the caller's problem, not
+    # a sign the database is unhealthy, so they must not trip the breaker for everyone
+    return isinstance(error, (sqlite3.OperationalError, connection_pool.PoolExhausted))
+
+
+class CircuitBreaker:
+    """
+    Trips open after `failures` database failures within `window` seconds.
+
+    While open every call fails fast with CircuitOpenError. After
+    `reset_timeout` seconds the circuit goes half-open and lets a single probe
+    call through: success closes it again, failure re-opens it. Every state
+    change is counted and passed to the optional on_state_change hook.
+    """
+
+    def __init__(self, failures=5, window=30.0, reset_timeout=10.0,
+                 is_failure=is_database_failure, on_state_change=None):
+        self.failures = failures
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.is_failure = is_failure
+        self.on_state_change = on_state_change
+        self.state = CLOSED
+        self.rejected = 0
+        self.transitions = {CLOSED: 0, OPEN: 0, HALF_OPEN: 0}
+        self._recent = deque()
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state):
+        previous, self.state = self.state, state
+        self.transitions[state] += 1
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state != OPEN:
+            self._recent.clear()
+        return previous, state
+
+    def _notify(self, change):
+        if change is not None and self.on_state_change is not None:
+            self.on_state_change(*change)
+
+    def before_call(self):
+        """Return True when this call is the half-open probe; raise when open."""
+        change = None
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                change = self._transition(HALF_OPEN)
+            if self.state == CLOSED:
+                probe = False
+            elif self.state == HALF_OPEN and not self._probing:
+                self._probing = probe = True
+            else:
+                self.rejected += 1
+                probe = None
+        self._notify(change)
+        if probe is None:
+            raise CircuitOpenError("database circuit is open, failing fast")
+        return probe
+
+    def record_success(self, probe):
+        change = None
+        with self._lock:
+            if probe:
+                self._probing = False
+                change = self._transition(CLOSED)
+        self._notify(change)
+
+    def release_probe(self, probe):
+        """The probe ended without a verdict; let the next call probe instead."""
+        if probe:
+            with self._lock:
+                self._probing = False
+
+    def record_failure(self, probe, error):
+        change = None
+        with self._lock:
+            if probe:
+                self._probing = False
+                if self.is_failure(error):
+                    change = self._transition(OPEN)
+                else:
+                    change = self._transition(CLOSED)
+            elif self.state == CLOSED and self.is_failure(error):
+                now = time.monotonic()
+                self._recent.append(now)
+                while self._recent and now - self._recent[0] > self.window:
+                    self._recent.popleft()
+                if len(self._recent) >= self.failures:
+                    change = self._transition(OPEN)
+        self._notify(change)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'recent_failures': len(self._recent),
+                'rejected': self.rejected,
+                'opened': self.transitions[OPEN],
+                'half_opened': self.transitions[HALF_OPEN],
+                'closed': self.transitions[CLOSED],
+            }
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            probe = self.before_call()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as error:
+                self.record_failure(probe, error)
+                raise
+            except BaseException:
+                # KeyboardInterrupt, SystemExit, ...: neither success nor failure
+                self.release_probe(probe)
+                raise
+            self.record_success(probe)
+            return result
+        return wrapper
+
+
+database_breaker = CircuitBreaker()
+
+
+def circuit_breaker(func=None, *, breaker=None):
+    """
+    Guard a database helper with a CircuitBreaker. Apply it above
+    with_db_connection so an open circuit does not even borrow a connection.
+    """
+    def decorator(func):
+        return (breaker or database_breaker)(func)
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+@circuit_breaker
+@connection_pool.with_db_connection
+@retry_backoff.retry_on_failure(retries=2, base_delay=0.05)
+def fetch_users_guarded(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users")
+    return cursor.fetchall()
+
+
+if __name__ == "__main__":
+    database_breaker.on_state_change = lambda old, new: print(f"circuit {old} -> {new}")
+    users = fetch_users_guarded()
+    print(len(users), database_breaker.stats())
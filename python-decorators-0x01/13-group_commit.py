@@ -0,0 +1,217 @@
+import time
+import queue
+import sqlite3
+import functools
+import threading
+from concurrent.futures import Future
+
+connection_pool = __import__('6-connection_pool')
+bounded_cache = __import__('7-bounded_cache')
+write_invalidation = __import__('8-write_invalidation')
+
+
+class GroupCommitter:
+    """
+    Applies queued writes from many callers in shared transactions.
+
+    A single writer thread takes up to max_batch operations, or whatever
+    arrived within max_delay seconds of the first one, and runs them in one
+    transaction, each inside its own SAVEPOINT. A failing operation is rolled
+    back to its savepoint and only its caller sees the error; the rest of the
+    batch still commits with a single fsync. Operations must not commit
+    themselves. If the writer thread cannot open its connection or dies, every
+    queued Future fails with the error and later submits raise at once.
+    """
+
+    def __init__(self, db_path=connection_pool.DB_PATH, max_batch=256, max_delay=0.005,
+                 cache=None, pragmas=connection_pool.DEFAULT_PRAGMAS):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.cache = cache
+        self.pragmas = tuple(pragmas)
+        self.batches = 0
+        self.operations = 0
+        self.failed_operations = 0
+        self.failed_batches = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._failure = None
+        self._thread = None
+        # Held while enqueueing, so nothing lands behind close()'s sentinel or
+        # after the writer thread drained the queue on its way out
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue func(conn, *args, **kwargs) and return a Future for its result."""
+        future = Future()
+        with self._lock:
+            if self._failure is not None:
+                raise RuntimeError("GroupCommitter writer thread failed") from self._failure
+            if self._closed:
+                raise RuntimeError("GroupCommitter is closed")
+            if self._thread is None:
+                # The writer thread starts with the first write, not at import
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+            self._queue.put((future, func, args, kwargs))
+        return future
+
+    def close(self):
+        """Apply everything already queued, then stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            if thread is not None:
+                self._queue.put(None)
+        if thread is not None:
+            thread.join()
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'operations': self.operations,
+            'mean_batch': self.operations / self.batches if self.batches else 0.0,
+            'failed_operations': self.failed_operations,
+            'failed_batches': self.failed_batches,
+            'queued': self._queue.qsize(),
+        }
+
+    def _run(self):
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            for name, value in self.pragmas:
+                conn.execute(f"PRAGMA {name} = {value}")
+            self._serve(conn)
+        except BaseException as error:
+            self._fail_queued(error)
+            raise
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _fail_queued(self, error):
+        with self._lock:
+            self._failure = error
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[0].set_running_or_notify_cancel():
+                item[0].set_exception(error)
+
+    def _serve(self, conn):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._apply(conn, batch)
+
+    def _apply(self, conn, batch):
+        batch = [item for item in batch if item[0].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        try:
+            with write_invalidation.track_writes(conn) as written:
+                conn.execute("BEGIN")
+                for future, func, args, kwargs in batch:
+                    conn.execute("SAVEPOINT operation")
+                    try:
+                        result = func(conn, *args, **kwargs)
+                    except Exception as error:
+                        conn.execute("ROLLBACK TO operation")
+                        conn.execute("RELEASE operation")
+                        outcomes.append((future, None, error))
+                    else:
+                        conn.execute("RELEASE operation")
+                        outcomes.append((future, result, None))
+                conn.execute("COMMIT")
+        except BaseException as error:
+            # The shared transaction itself failed, or an operation raised something
+            # like KeyboardInterrupt that stops the writer: nobody's write is durable.
+            # Resolve the batch first so its callers are not left waiting either way
+            self.failed_batches += 1
+            self.failed_operations += len(batch)
+            for future, *_ in batch:
+                future.set_exception(error)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            if not isinstance(error, Exception):
+                raise
+            return
+        if written:
+            (self.cache if self.cache is not None else bounded_cache.query_cache).invalidate_tables(written)
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                self.failed_operations += 1
+                future.set_exception(error)
+
+
+def transactional(func=None, *, group=None, cache=None):
+    """
+    Without group this is the per-call transactional decorator: the function
+    receives a connection from with_db_connection and commits on its own.
+
+    With group=GroupCommitter(...) the decorated function is called without a
+    connection; the call is queued, applied in the next group transaction and
+    blocks until that commits. wrapper.submit() queues without waiting and
+    returns the Future, which is how batch jobs reach high throughput.
+    """
+    def decorator(func):
+        if group is None:
+            return write_invalidation.transactional(func, cache=cache)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return group.submit(func, *args, **kwargs).result()
+
+        wrapper.submit = functools.partial(group.submit, func)
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+committer = GroupCommitter()
+
+
+@transactional(group=committer)
+def update_user_email(conn, user_id, new_email):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+    return cursor.rowcount
+
+
+if __name__ == "__main__":
+    print(update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com'))
+
+    started = time.perf_counter()
+    futures = [update_user_email.submit(user_id, f"user{user_id}@example.com")
+               for user_id in range(1, 5001)]
+    updated = sum(future.result() for future in futures)
+    elapsed = time.perf_counter() - started
+    print(f"{updated} updates in {elapsed:.3f}s ({updated / elapsed:.0f}/s)")
+    committer.close()
+    print(committer.stats())
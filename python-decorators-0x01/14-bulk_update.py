@@ -0,0 +1,78 @@
+import re
+import itertools
+
+with_db_connection = __import__('6-connection_pool').with_db_connection
+transactional = __import__('8-write_invalidation').transactional
+
+_NAME = re.compile(r'^[A-Za-z_]\w*$')
+
+
+def _check_name(name):
+    # Table and column names cannot be bound as parameters, so only plain identifiers pass
+    if not _NAME.match(name):
+        raise ValueError(f"invalid identifier: {name!r}")
+    return name
+
+
+def _chunks(pairs, size):
+    iterator = iter(pairs)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_update(conn, table, column, pairs, key='id', chunk_size=5000, staging_threshold=1000):
+    """
+    Set table.column for many (key, value) pairs on one connection.
+
+    pairs may be any iterable and is consumed chunk_size at a time, so memory
+    stays bounded. Chunks smaller than staging_threshold go through
+    executemany; larger ones are staged in a temp table and applied with a
+    single joined UPDATE ... FROM (SQLite 3.33+). When a key repeats, its last
+    value wins. Does not commit: wrap the caller in transactional.
+    """
+    table, column, key = _check_name(table), _check_name(column), _check_name(key)
+    update = f"UPDATE {table} SET {column} = ? WHERE {key} = ?"
+    joined_update = (
+        f"UPDATE {table} SET {column} = staged.value FROM temp._bulk_update AS staged "
+        f"WHERE {table}.{key} = staged.key"
+    )
+    totals = {'pairs': 0, 'updated': 0, 'chunks': 0, 'staged_chunks': 0}
+    staging = False
+    cursor = conn.cursor()
+    try:
+        for chunk in _chunks(pairs, chunk_size):
+            totals['pairs'] += len(chunk)
+            totals['chunks'] += 1
+            if len(chunk) < staging_threshold:
+                cursor.executemany(update, [(value, row_key) for row_key, value in chunk])
+                totals['updated'] += cursor.rowcount
+                continue
+            if not staging:
+                cursor.execute("CREATE TEMP TABLE IF NOT EXISTS _bulk_update "
+                               "(key PRIMARY KEY, value) WITHOUT ROWID")
+                staging = True
+            cursor.execute("DELETE FROM temp._bulk_update")
+            cursor.executemany("INSERT OR REPLACE INTO temp._bulk_update (key, value) VALUES (?, ?)",
+                               chunk)
+            cursor.execute(joined_update)
+            totals['updated'] += cursor.rowcount
+            totals['staged_chunks'] += 1
+    finally:
+        if staging:
+            cursor.execute("DROP TABLE IF EXISTS temp._bulk_update")
+    return totals
+
+
+@with_db_connection
+@transactional
+def bulk_update_user_emails(conn, pairs):
+    """Update many users' emails from (user_id, new_email) pairs in one transaction."""
+    return bulk_update(conn, 'users', 'email', pairs)
+
+
+if __name__ == "__main__":
+    print(bulk_update_user_emails([(1, 'Crawford_Cartwright@hotmail.com'), (2, 'Lee_Ritchie@yahoo.com')]))
+    print(bulk_update_user_emails((user_id, f"user{user_id}@example.com") for user_id in range(1, 20001)))
@@ -0,0 +1,158 @@
+import time
+import sqlite3
+import threading
+
+connection_pool = __import__('6-connection_pool')
+
+# sqlite3.connect's own default statement cache size
+DEFAULT_CACHED_STATEMENTS = 128
+
+
+class PreparedConnection(sqlite3.Connection):
+    """Connection that remembers which registered queries it has prepared."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class QueryRegistry:
+    """
+    Named queries declared once at import time.
+
+    Pools built by pool() make sure each connection's sqlite3 statement cache
+    holds the whole registry plus some slack for ad-hoc SQL; it is never made
+    smaller than sqlite3's default of 128. Once a connection has run a
+    registered query it is then not parsed again on that connection. Hits and
+    misses are the registry's own bookkeeping of first use versus reuse per
+    connection, not counters read from sqlite3; they assume the slack is
+    enough that ad-hoc SQL does not push registered statements out.
+    """
+
+    def __init__(self, slack=16):
+        self.slack = slack
+        self.hits = 0
+        self.misses = 0
+        self._queries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._queries)
+
+    def __contains__(self, name):
+        return name in self._queries
+
+    def register(self, name, sql):
+        existing = self._queries.get(name)
+        if existing is not None and existing != sql:
+            raise ValueError(f"query {name!r} is already registered with different SQL")
+        self._queries[name] = sql
+        return name
+
+    def sql(self, name):
+        try:
+            return self._queries[name]
+        except KeyError:
+            raise KeyError(f"unknown query: {name!r}") from None
+
+    def connect_kwargs(self):
+        return {
+            'factory': PreparedConnection,
+            'cached_statements': max(DEFAULT_CACHED_STATEMENTS, len(self) + self.slack),
+        }
+
+    def pool(self, db_path=connection_pool.DB_PATH, **kwargs):
+        """ConnectionPool whose connections cache every registered statement."""
+        return connection_pool.ConnectionPool(db_path, connect_kwargs=self.connect_kwargs(), **kwargs)
+
+    def _track(self, conn, name):
+        prepared = getattr(conn, 'prepared', None)
+        if prepared is None:
+            return
+        hit = name in prepared
+        if not hit:
+            prepared.add(name)
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def execute(self, conn, name, params=()):
+        sql = self.sql(name)
+        self._track(conn, name)
+        return conn.execute(sql, params)
+
+    def executemany(self, conn, name, seq_of_params):
+        sql = self.sql(name)
+        self._track(conn, name)
+        return conn.executemany(sql, seq_of_params)
+
+    def stats(self):
+        with self._lock:
+            executions = self.hits + self.misses
+            return {
+                'queries': len(self),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / executions if executions else 0.0,
+            }
+
+
+registry = QueryRegistry()
+registry.register('user_by_id', "SELECT * FROM users WHERE id = ?")
+registry.register('all_users', "SELECT * FROM users")
+registry.register('users_older_than', "SELECT * FROM users WHERE age > ?")
+registry.register('update_user_email', "UPDATE users SET email = ? WHERE id = ?")
+
+registry_pool = registry.pool()
+
+
+@connection_pool.with_db_connection(pool=registry_pool)
+def get_user_by_id(conn, user_id):
+    return registry.execute(conn, 'user_by_id', (user_id,)).fetchone()
+
+
+@connection_pool.with_db_connection(pool=registry_pool)
+def fetch_users_older_than(conn, age):
+    return registry.execute(conn, 'users_older_than', (age,)).fetchall()
+
+
+def benchmark(calls=20000, db_path=connection_pool.DB_PATH):
+    """
+    Per-call cost of get_user_by_id: a new connection per call, a pool that
+    parses every call, a plain pool with sqlite3's default statement cache,
+    and the registry pool. The last two should match for a registry this
+    small; the registry pool only pulls ahead once the registry plus ad-hoc
+    SQL outgrow the default cache.
+    """
+    sql = registry.sql('user_by_id')
+
+    def run(label, pool):
+        with pool.connection() as conn:
+            started = time.perf_counter()
+            for user_id in range(calls):
+                conn.execute(sql, (user_id % 1000 + 1,)).fetchone()
+            elapsed = time.perf_counter() - started
+        pool.close()
+        print(f"{label:>32}: {elapsed / calls * 1e6:7.2f} us/call")
+
+    started = time.perf_counter()
+    for user_id in range(calls // 10):
+        conn = sqlite3.connect(db_path)
+        conn.execute(sql, (user_id % 1000 + 1,)).fetchone()
+        conn.close()
+    elapsed = time.perf_counter() - started
+    print(f"{'new connection per call':>32}: {elapsed / (calls // 10) * 1e6:7.2f} us/call")
+    run('pooled, statement parsed per call',
+        connection_pool.ConnectionPool(db_path, connect_kwargs={'cached_statements': 0}))
+    run('pooled, default statement cache', connection_pool.ConnectionPool(db_path))
+    run('pooled, registry statement cache', registry.pool(db_path))
+
+
+if __name__ == "__main__":
+    print(get_user_by_id(1))
+    print(len(fetch_users_older_than(40)))
+    print(get_user_by_id(2))
+    print(registry.stats())
+    benchmark()
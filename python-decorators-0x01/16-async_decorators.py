@@ -0,0 +1,338 @@
+import time
+import asyncio
+import inspect
+import weakref
+import functools
+import contextlib
+import aiosqlite
+
+query_logging = __import__('5-query_logging')
+connection_pool = __import__('6-connection_pool')
+bounded_cache = __import__('7-bounded_cache')
+write_invalidation = __import__('8-write_invalidation')
+retry_backoff = __import__('11-retry_backoff')
+
+_MISSING = object()
+
+
+class AsyncConnectionPool:
+    """
+    Bounded pool of aiosqlite connections for coroutine helpers.
+
+    Same behaviour and stats as ConnectionPool, but waiting for a free
+    connection suspends the coroutine instead of blocking the event loop.
+    A pool belongs to the event loop it is first used on.
+    """
+
+    def __init__(self, db_path=connection_pool.DB_PATH, size=5, timeout=5.0,
+                 pragmas=connection_pool.DEFAULT_PRAGMAS):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pragmas = tuple(pragmas)
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self._idle = None
+        self._created = 0
+        self._opened = []
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.db_path)
+        for name, value in self.pragmas:
+            await conn.execute(f"PRAGMA {name} = {value}")
+        self.misses += 1
+        self._opened.append(conn)
+        return conn
+
+    async def acquire(self):
+        if self._idle is None:
+            self._idle = asyncio.LifoQueue()
+        try:
+            conn = self._idle.get_nowait()
+        except asyncio.QueueEmpty:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return await self._connect()
+                except BaseException:
+                    self._created -= 1
+                    raise
+            started = time.perf_counter()
+            try:
+                conn = await asyncio.wait_for(self._idle.get(), self.timeout)
+            except asyncio.TimeoutError:
+                raise connection_pool.PoolExhausted(
+                    f"no connection to {self.db_path} free after {self.timeout}s") from None
+            finally:
+                self.waits += 1
+                self.wait_time += time.perf_counter() - started
+        self.hits += 1
+        return conn
+
+    async def release(self, conn):
+        if conn.in_transaction:
+            await conn.rollback()
+        self._idle.put_nowait(conn)
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        finally:
+            await self.release(conn)
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'waits': self.waits,
+            'wait_time': self.wait_time,
+            'open': len(self._opened),
+            'idle': self._idle.qsize() if self._idle is not None else 0,
+        }
+
+    async def close(self):
+        opened, self._opened = self._opened, []
+        self._idle = None
+        self._created = 0
+        for conn in opened:
+            await conn.close()
+
+
+_default_pools = weakref.WeakKeyDictionary()
+
+
+def get_default_async_pool():
+    """The AsyncConnectionPool of the running event loop."""
+    loop = asyncio.get_running_loop()
+    pool = _default_pools.get(loop)
+    if pool is None:
+        pool = _default_pools[loop] = AsyncConnectionPool()
+    return pool
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines: concurrent awaits of one key share a task,
+    as long as they expect the same data version as the task started from.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+
+    async def do(self, key, coro_fn, version=None):
+        call = self._calls.get(key)
+        if call is not None and call[0] != version:
+            return await coro_fn()  # a write landed since the running task started
+        if call is None:
+            task = asyncio.ensure_future(coro_fn())
+            self._calls[key] = (version, task)
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            task = call[1]
+            self.coalesced += 1
+        # shield: one caller being cancelled must not cancel the shared query
+        return await asyncio.shield(task)
+
+
+query_flight = AsyncSingleFlight()
+
+
+def log_queries(func=None, *, logger=None, stats=None):
+    def decorator(func):
+        if not inspect.iscoroutinefunction(func):
+            return query_logging.log_queries(func, logger=logger, stats=stats)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            active = logger
+            if active is None and stats is None:
+                active = query_logging.get_default_logger()
+            log = active is not None and active.sampled()
+            if not log and stats is None:
+                return await func(*args, **kwargs)
+            query = query_logging._query_of(args, kwargs)
+            rows = None
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+                rows = query_logging._row_count(result)
+                return result
+            finally:
+                duration = time.perf_counter() - started
+                if log:
+                    active.record(query, duration, rows)
+                if stats is not None:
+                    stats.record(query, duration, rows)
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def with_db_connection(func=None, *, pool=None):
+    def decorator(func):
+        if not inspect.iscoroutinefunction(func):
+            return connection_pool.with_db_connection(func, pool=pool)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with (pool or get_default_async_pool()).connection() as conn:
+                return await func(conn, *args, **kwargs)
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def transactional(func=None, *, cache=None):
+    def decorator(func):
+        if not inspect.iscoroutinefunction(func):
+            return write_invalidation.transactional(func, cache=cache)
+
+        @functools.wraps(func)
+        async def wrapper(conn, *args, **kwargs):
+            written = set()
+            await conn.set_trace_callback(
+                lambda statement: written.update(bounded_cache.tables_written(statement)))
+            try:
+                await conn.execute("BEGIN TRANSACTION")
+                result = await func(conn, *args, **kwargs)
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+            finally:
+                await conn.set_trace_callback(None)
+            if written:
+                (cache if cache is not None else bounded_cache.query_cache).invalidate_tables(written)
+            return result
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def retry_on_failure(retries=3, base_delay=0.05, max_delay=2.0, max_total_delay=5.0,
+                     retry_on=retry_backoff.is_transient, budget=None, metrics=None):
+    sync_decorator = retry_backoff.retry_on_failure(retries, base_delay, max_delay, max_total_delay,
+                                                    retry_on, budget, metrics)
+    policy = retry_backoff.RetryPolicy(retries, base_delay, max_delay, max_total_delay,
+                                       retry_on, budget, metrics)
+
+    def decorator(func):
+        if not inspect.iscoroutinefunction(func):
+            return sync_decorator(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            policy.start()
+            slept = 0.0
+            attempt = 0
+            while True:
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception as error:
+                    pause = policy.pause(error, attempt, slept)
+                    if pause is None:
+                        raise
+                    # Yield to the event loop instead of blocking it
+                    await asyncio.sleep(pause)
+                    slept += pause
+                    attempt += 1
+                    continue
+                policy.succeeded(attempt)
+                return result
+        return wrapper
+    return decorator
+
+
+@contextlib.asynccontextmanager
+async def record_reads(conn):
+    """bounded_cache.record_reads() for an aiosqlite connection."""
+    tables, authorizer = bounded_cache.start_recording(conn)
+    if authorizer is not None:
+        await conn.set_authorizer(authorizer)
+    try:
+        yield tables
+    finally:
+        if bounded_cache.stop_recording(conn, tables):
+            await conn.set_authorizer(None)
+
+
+def cache_query(func=None, *, cache=None, single_flight=True, pool=None):
+    def decorator(func):
+        if not inspect.iscoroutinefunction(func):
+            return bounded_cache.cache_query(func, cache=cache, single_flight=single_flight)
+
+        @functools.wraps(func)
+        async def wrapper(conn, query, *args, **kwargs):
+            active = cache if cache is not None else bounded_cache.query_cache
+            key = bounded_cache.make_key(query, args, kwargs)
+            result = active.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+            before = active.generations()
+
+            async def load(conn):
+                async with record_reads(conn) as tables:
+                    result = active.pack(await func(conn, query, *args, **kwargs))
+                generation = tuple(before.get(table, 0) for table in sorted(tables))
+                active.put(key, result, frozenset(tables), generation)
+                return result
+
+            if single_flight:
+                async def shared_load():
+                    # The shared task outlives a cancelled caller, whose connection goes
+                    # back to its pool meanwhile, so it borrows a connection of its own
+                    async with (pool or get_default_async_pool()).connection() as own:
+                        return await load(own)
+
+                return await query_flight.do(
+                    (active, func, key), shared_load, tuple(sorted(before.items())))
+            return await load(conn)
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+@with_db_connection
+@cache_query
+async def fetch_users_with_cache(conn, query, params=()):
+    async with conn.execute(query, params) as cursor:
+        return await cursor.fetchall()
+
+
+@with_db_connection
+@retry_on_failure(retries=3, base_delay=0.1)
+async def fetch_users_with_retry(conn):
+    async with conn.execute("SELECT * FROM users") as cursor:
+        return await cursor.fetchall()
+
+
+@with_db_connection
+@transactional
+async def update_user_email(conn, user_id, new_email):
+    await conn.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+
+
+async def main():
+    results = await asyncio.gather(*(fetch_users_with_cache(query="SELECT * FROM users")
+                                     for _ in range(20)))
+    print(len(results[0]), f"coalesced={query_flight.coalesced}")
+    await update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
+    print(len(await fetch_users_with_retry()))
+    pool = get_default_async_pool()
+    print(pool.stats(), bounded_cache.query_cache.stats())
+    await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,212 @@
+import time
+import inspect
+import functools
+
+query_logging = __import__('5-query_logging')
+connection_pool = __import__('6-connection_pool')
+bounded_cache = __import__('7-bounded_cache')
+write_invalidation = __import__('8-write_invalidation')
+retry_backoff = __import__('11-retry_backoff')
+
+_MISSING = object()
+
+
+def _retry_policy(retry):
+    options = {'retries': 3, 'base_delay': 0.05, 'max_delay': 2.0, 'max_total_delay': 5.0,
+               'retry_on': retry_backoff.is_transient, 'budget': None, 'metrics': None}
+    if isinstance(retry, int) and not isinstance(retry, bool):
+        options['retries'] = retry
+    elif isinstance(retry, dict):
+        unknown = set(retry) - set(options)
+        if unknown:
+            raise TypeError(f"unknown retry options: {sorted(unknown)}")
+        options.update(retry)
+    return retry_backoff.RetryPolicy(**options)
+
+
+def db_call(cache=None, retry=None, tx=False, log=None, pool=None, single_flight=True):
+    """
+    One decorator replacing the stack of with_db_connection, transactional,
+    retry_on_failure, cache_query and log_queries.
+
+    cache: True for query_cache, or any QueryCache-like object.
+    retry: True for defaults, a retry count, or a dict of retry_on_failure options.
+    tx: run every attempt in its own transaction, invalidating the cache on commit.
+    log: True for the default QueryLogger, a QueryLogger, or a QueryStats.
+    pool: ConnectionPool to borrow from, the default pool otherwise.
+
+    Everything is resolved when the function is decorated, so a call pays for
+    one wrapper frame and a truth test per disabled feature. A cache hit
+    returns before a connection is borrowed; only real executions are logged.
+    """
+    if cache is True:
+        cache = bounded_cache.query_cache
+    elif cache is False:
+        # An empty cache is falsy (it has __len__), so compare to False explicitly
+        cache = None
+    stats = log if isinstance(log, query_logging.QueryStats) else None
+    logger = query_logging.get_default_logger() if log is True else (
+        log if isinstance(log, query_logging.QueryLogger) else None)
+    policy = _retry_policy(retry) if retry else None
+    flight = bounded_cache.query_flight if cache is not None and single_flight else None
+    cache_target = cache if cache is not None else bounded_cache.query_cache
+
+    def decorator(func):
+        if tx:
+            def execute(conn, args, kwargs):
+                with write_invalidation.track_writes(conn) as written:
+                    try:
+                        conn.execute("BEGIN TRANSACTION")
+                        result = func(conn, *args, **kwargs)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                if written:
+                    cache_target.invalidate_tables(written)
+                return result
+        else:
+            def execute(conn, args, kwargs):
+                return func(conn, *args, **kwargs)
+
+        if policy is not None:
+            run_once = execute
+
+            def execute(conn, args, kwargs):
+                policy.start()
+                slept = 0.0
+                attempt = 0
+                while True:
+                    try:
+                        result = run_once(conn, args, kwargs)
+                    except Exception as error:
+                        pause = policy.pause(error, attempt, slept)
+                        if pause is None:
+                            raise
+                        time.sleep(pause)
+                        slept += pause
+                        attempt += 1
+                        continue
+                    policy.succeeded(attempt)
+                    return result
+
+        def call(args, kwargs, reads=None):
+            with (pool or connection_pool.get_default_pool()).connection() as conn:
+                if reads is None:
+                    return execute(conn, args, kwargs)
+                with bounded_cache.record_reads(conn) as tables:
+                    try:
+                        return execute(conn, args, kwargs)
+                    finally:
+                        reads.update(tables)
+
+        if logger is not None or stats is not None:
+            run_call = call
+
+            def call(args, kwargs, reads=None):
+                log_this = logger is not None and logger.sampled()
+                if not log_this and stats is None:
+                    return run_call(args, kwargs, reads)
+                query = query_logging._query_of(args, kwargs)
+                rows = None
+                started = time.perf_counter()
+                try:
+                    result = run_call(args, kwargs, reads)
+                    rows = query_logging._row_count(result)
+                    return result
+                finally:
+                    duration = time.perf_counter() - started
+                    try:
+                        if log_this:
+                            logger.record(query, duration, rows)
+                        if stats is not None:
+                            stats.record(query, duration, rows)
+                    except Exception:
+                        pass  # bookkeeping must never fail or mask the call it describes
+
+        if cache is None:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return call(args, kwargs)
+            return wrapper
+
+        # Entries are keyed on the function and its arguments, positional ones under their
+        # parameter names so f(1) and f(user_id=1) share one; the tables they are tagged
+        # with come from the statements the call actually runs, not from a query argument
+        identity = (func.__module__, func.__qualname__)
+        named = []
+        for parameter in list(inspect.signature(func).parameters.values())[1:]:
+            if parameter.kind is not parameter.POSITIONAL_OR_KEYWORD:
+                break
+            named.append(parameter.name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = bounded_cache.make_key(
+                identity, args[len(named):], {**dict(zip(named, args)), **kwargs})
+            result = cache.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+            before = cache.generations()
+
+            def load():
+                tables = set()
+                result = cache.pack(call(args, kwargs, tables))
+                generation = tuple(before.get(table, 0) for table in sorted(tables))
+                cache.put(key, result, frozenset(tables), generation)
+                return result
+
+            if flight is not None:
+                return flight.do((cache, func, key), load, tuple(sorted(before.items())))
+            return load()
+        return wrapper
+    return decorator
+
+
+@db_call(cache=True, retry=3, log=True)
+def fetch_users_with_cache(conn, query, params=()):
+    return conn.execute(query, params).fetchall()
+
+
+@db_call(tx=True, retry=True)
+def update_user_email(conn, user_id, new_email):
+    conn.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+
+
+def benchmark(calls=20000):
+    """
+    Per-call cost of the fused decorator against the equivalent stack. The
+    stack logs below the cache like db_call does, so hits skip logging in
+    both; the stack still borrows a connection on a hit, since cache_query
+    needs one passed in.
+    """
+    pool = connection_pool.ConnectionPool()
+    stats = query_logging.QueryStats()
+    query = "SELECT * FROM users WHERE id = ?"
+
+    def body(conn, query, params=()):
+        return conn.execute(query, params).fetchone()
+
+    for cached in (False, True):
+        cache = bounded_cache.QueryCache() if cached else None
+        stacked = retry_backoff.retry_on_failure(retries=3)(body)
+        stacked = query_logging.log_queries(stacked, stats=stats)
+        if cached:
+            stacked = bounded_cache.cache_query(stacked, cache=cache)
+        stacked = connection_pool.with_db_connection(stacked, pool=pool)
+        fused = db_call(cache=cache, retry=3, log=stats, pool=pool)(body)
+        for label, fn in (('stacked', stacked), ('db_call', fused)):
+            started = time.perf_counter()
+            for user_id in range(calls):
+                fn(query=query, params=(user_id % 100 + 1,))
+            elapsed = time.perf_counter() - started
+            print(f"{'cached' if cached else 'uncached':>9} {label:>8}: "
+                  f"{elapsed / calls * 1e6:7.2f} us/call")
+    pool.close()
+
+
+if __name__ == "__main__":
+    update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
+    print(len(fetch_users_with_cache(query="SELECT * FROM users")))
+    benchmark()
+    query_logging.get_default_logger().close()
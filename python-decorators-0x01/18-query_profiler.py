@@ -0,0 +1,167 @@
+import re
+import sys
+import time
+import random
+import sqlite3
+import functools
+import threading
+
+query_logging = __import__('5-query_logging')
+connection_pool = __import__('6-connection_pool')
+
+# "SCAN users" (SQLite 3.36+) or "SCAN TABLE users"; index scans are fine, and
+# so are the constant row of a FROM-less SELECT, old-style "SCAN SUBQUERY n"
+# lines and virtual tables, none of which is a table that an index could fix
+_FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(?!CONSTANT ROW\b|SUBQUERY \d)(\w+)'
+                        r'(?!.*\b(?:USING (?:COVERING )?INDEX|VIRTUAL TABLE)\b)')
+# CTEs and FROM-clause subqueries are scanned by name too, but are not tables
+_SUBQUERY = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (\w+)')
+# Plans name each scan by its alias when the query gives one: "FROM users a" scans "a"
+_ALIASED = re.compile(r'(?:\bFROM|\bJOIN|,)\s+[`"\[]?([\w.]+)[`"\]]?\s+(?:AS\s+)?(\w+)',
+                      re.IGNORECASE)
+_NOT_ALIASES = frozenset((
+    'as', 'cross', 'except', 'from', 'full', 'group', 'having', 'indexed', 'inner',
+    'intersect', 'join', 'left', 'limit', 'natural', 'not', 'on', 'order', 'outer',
+    'right', 'select', 'union', 'using', 'values', 'where', 'window'))
+_EXPLAINABLE = re.compile(r'^\s*(?:WITH|SELECT|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+def _aliases(query):
+    return {alias: table.rsplit('.', 1)[-1] for table, alias in _ALIASED.findall(query)
+            if alias.lower() not in _NOT_ALIASES}
+
+
+def full_scans(plan, query=''):
+    """
+    Tables read by a full scan in an EXPLAIN QUERY PLAN detail list, each
+    once; pass the query so aliases in the plan resolve to table names.
+    """
+    aliases = _aliases(query)
+    subqueries = {match.group(1) for match in map(_SUBQUERY.match, plan) if match}
+    scanned = (aliases.get(match.group(1), match.group(1))
+               for match in map(_FULL_SCAN.match, plan) if match)
+    return list(dict.fromkeys(name for name in scanned if name not in subqueries))
+
+
+class _Profile:
+    __slots__ = ('calls', 'total_time', 'max_time', 'rows', 'plan', 'scans')
+
+    def __init__(self):
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.plan = None
+        self.scans = []
+
+
+class QueryProfiler:
+    """
+    Per-fingerprint timings and query plans.
+
+    The first profiled call of every distinct query also runs EXPLAIN QUERY
+    PLAN on the same connection and flags tables it reads with a full scan.
+    sample_rate=1.0 profiles everything (tests); a small rate keeps the cost
+    negligible for always-on use in production.
+    """
+
+    def __init__(self, sample_rate=1.0):
+        self.sample_rate = sample_rate
+        self._profiles = {}
+        self._lock = threading.Lock()
+
+    def sampled(self):
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+    def needs_plan(self, key):
+        with self._lock:
+            profile = self._profiles.get(key)
+            return profile is None or profile.plan is None
+
+    def explain(self, conn, key, query, params):
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            plan = [row[-1] for row in rows]
+        except sqlite3.Error as error:
+            plan = [f"EXPLAIN failed: {error}"]
+        with self._lock:
+            profile = self._profiles.setdefault(key, _Profile())
+            profile.plan = plan
+            profile.scans = full_scans(plan, query)
+
+    def record(self, key, duration, rows):
+        with self._lock:
+            profile = self._profiles.setdefault(key, _Profile())
+            profile.calls += 1
+            profile.total_time += duration
+            if duration > profile.max_time:
+                profile.max_time = duration
+            profile.rows += rows or 0
+
+    def flagged(self):
+        """Fingerprints whose plan contains a full table scan, with the tables."""
+        with self._lock:
+            return {key: list(profile.scans) for key, profile in self._profiles.items()
+                    if profile.scans}
+
+    def assert_no_full_scans(self):
+        flagged = self.flagged()
+        if flagged:
+            details = '; '.join(f"{query} (scans {', '.join(tables)})"
+                                for query, tables in flagged.items())
+            raise AssertionError(f"queries without a usable index: {details}")
+
+    def report(self, stream=None):
+        """Write every profiled query, heaviest first, with its plan."""
+        stream = stream or sys.stdout
+        with self._lock:
+            profiles = sorted(self._profiles.items(), key=lambda item: item[1].total_time,
+                              reverse=True)
+            for key, profile in profiles:
+                flag = 'FULL SCAN ' if profile.scans else ''
+                stream.write(f"{flag}{profile.calls} calls, {profile.total_time * 1000:.2f} ms total, "
+                             f"{profile.max_time * 1000:.3f} ms max, {profile.rows} rows: {key}\n")
+                for step in profile.plan or ():
+                    stream.write(f"    {step}\n")
+
+
+query_profiler = QueryProfiler()
+
+
+def profile_queries(func=None, *, profiler=None):
+    """
+    Profile a function called as func(conn, query, params=()), as the helpers
+    below with_db_connection are. Unsampled calls go straight through.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(conn, query, *args, **kwargs):
+            active = profiler or query_profiler
+            if not active.sampled():
+                return func(conn, query, *args, **kwargs)
+            key = query_logging.fingerprint(query)
+            if active.needs_plan(key) and _EXPLAINABLE.match(query):
+                params = kwargs.get('params', args[0] if args else ())
+                active.explain(conn, key, query, params)
+            started = time.perf_counter()
+            result = func(conn, query, *args, **kwargs)
+            active.record(key, time.perf_counter() - started, query_logging._row_count(result))
+            return result
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+@connection_pool.with_db_connection
+@profile_queries
+def run_query(conn, query, params=()):
+    return conn.execute(query, params).fetchall()
+
+
+if __name__ == "__main__":
+    run_query(query="SELECT * FROM users WHERE id = ?", params=(1,))
+    run_query(query="SELECT * FROM users WHERE email = ?", params=('Crawford_Cartwright@hotmail.com',))
+    run_query(query="SELECT * FROM users WHERE age > ?", params=(40,))
+    query_profiler.report()
+    print(query_profiler.flagged())
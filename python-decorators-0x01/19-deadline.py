@@ -0,0 +1,114 @@
+import math
+import time
+import threading
+import sqlite3
+import functools
+import contextlib
+import contextvars
+
+connection_pool = __import__('6-connection_pool')
+retry_backoff = __import__('11-retry_backoff')
+
+# Absolute time.monotonic() deadline of the current call chain
+_deadline = contextvars.ContextVar('query_deadline', default=math.inf)
+
+# SQLite VM instructions between two deadline checks
+PROGRESS_STEPS = 1000
+
+# id() of the connections a deadline wrapper has installed _expired on. The
+# handler reads the current deadline when it fires, so nested wrappers on the
+# same connection share it and only the one that installed it removes it
+_armed = set()
+_armed_lock = threading.Lock()
+
+
+class QueryTimeout(sqlite3.OperationalError):
+    """A query ran out of its deadline and was aborted."""
+
+    # The budget is spent, so retry_on_failure must give up instead of retrying
+    retryable = False
+
+
+def remaining():
+    """Seconds left before the current deadline, math.inf without one."""
+    return _deadline.get() - time.monotonic()
+
+
+@contextlib.contextmanager
+def deadline_scope(seconds):
+    """
+    Give everything run in the block at most `seconds`. Nested scopes can
+    only shorten the deadline of the enclosing one, never extend it.
+    """
+    token = _deadline.set(min(_deadline.get(), time.monotonic() + seconds))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _expired():
+    # Non-zero tells SQLite to abort the running statement
+    return time.monotonic() >= _deadline.get()
+
+
+def deadline(seconds=None):
+    """
+    Abort the queries of func(conn, ...) once the deadline passes.
+
+    Installs a progress handler on the connection, so a runaway statement is
+    interrupted mid-execution and surfaces as QueryTimeout. seconds=None only
+    enforces a deadline inherited from an enclosing deadline or scope.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(conn, *args, **kwargs):
+            with deadline_scope(math.inf if seconds is None else seconds):
+                if remaining() <= 0:
+                    raise QueryTimeout("deadline exceeded before the query started")
+                if _deadline.get() == math.inf:
+                    return func(conn, *args, **kwargs)
+                with _armed_lock:
+                    installs = id(conn) not in _armed
+                    _armed.add(id(conn))
+                if installs:
+                    conn.set_progress_handler(_expired, PROGRESS_STEPS)
+                try:
+                    return func(conn, *args, **kwargs)
+                except sqlite3.OperationalError as error:
+                    if remaining() <= 0 and not isinstance(error, QueryTimeout):
+                        raise QueryTimeout(f"query aborted after its deadline: {error}") from error
+                    raise
+                finally:
+                    if installs:
+                        conn.set_progress_handler(None, PROGRESS_STEPS)
+                        with _armed_lock:
+                            _armed.discard(id(conn))
+        return wrapper
+    return decorator
+
+
+@connection_pool.with_db_connection
+@retry_backoff.retry_on_failure(retries=2)
+@deadline(0.05)
+def count_user_pairs(conn):
+    # A deliberately quadratic query that cannot finish within the budget
+    return conn.execute("SELECT COUNT(*) FROM users a, users b, users c").fetchone()
+
+
+@connection_pool.with_db_connection
+@deadline()
+def get_user_by_id(conn, user_id):
+    return conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+
+
+if __name__ == "__main__":
+    started = time.monotonic()
+    try:
+        count_user_pairs()
+    except QueryTimeout as error:
+        print(f"{error} after {time.monotonic() - started:.3f}s")
+    print(retry_backoff.retry_metrics.snapshot())
+    with deadline_scope(1.0):
+        # Inherits the one second budget from the enclosing scope
+        print(get_user_by_id(1))
@@ -0,0 +1,59 @@
+import functools
+
+connection_pool = __import__('6-connection_pool')
+retry_backoff = __import__('11-retry_backoff')
+
+
+def with_db_stream(func=None, *, arraysize=500, chunks=False, pool=None):
+    """
+    Streaming counterpart of with_db_connection.
+
+    The decorated function receives a pooled connection and returns an
+    executed cursor instead of cursor.fetchall(). The wrapper is a generator
+    that fetches arraysize rows at a time and yields them one by one (or as
+    lists with chunks=True). The connection is borrowed on the first next()
+    and held until the generator is exhausted, closed or garbage collected,
+    so abandoned or half-read streams still give it back.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with (pool or connection_pool.get_default_pool()).connection() as conn:
+                cursor = func(conn, *args, **kwargs)
+                try:
+                    cursor.arraysize = arraysize
+                    while True:
+                        rows = cursor.fetchmany()
+                        if not rows:
+                            break
+                        if chunks:
+                            yield rows
+                        else:
+                            yield from rows
+                finally:
+                    cursor.close()
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+@with_db_stream
+def stream_all_users(conn, query):
+    return conn.execute(query)
+
+
+@with_db_stream(arraysize=1000, chunks=True)
+@retry_backoff.retry_on_failure(retries=3, base_delay=0.1)
+def stream_users_with_retry(conn):
+    # Only executing the query is retried; rows already yielded cannot be
+    return conn.execute("SELECT * FROM users")
+
+
+if __name__ == "__main__":
+    for user in stream_all_users(query="SELECT * FROM users"):
+        if user[0] > 3:
+            break  # leaving early closes the cursor and returns the connection
+        print(user)
+    print(sum(len(chunk) for chunk in stream_users_with_retry()))
+    print(connection_pool.get_default_pool().stats())
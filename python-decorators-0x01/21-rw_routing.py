@@ -0,0 +1,121 @@
+import pathlib
+import functools
+import threading
+import contextlib
+
+connection_pool = __import__('6-connection_pool')
+
+# journal_mode and synchronous cannot be changed from a read-only connection
+READ_PRAGMAS = tuple((name, value) for name, value in connection_pool.DEFAULT_PRAGMAS
+                     if name not in ('journal_mode', 'synchronous'))
+
+
+class ConnectionRouter:
+    """
+    Sends reads and writes to separate connections of the same database.
+
+    The database is switched to WAL once, so readers never block the writer
+    or each other. Reads share a pool of `mode=ro` URI connections, which
+    SQLite itself refuses to write through. Writes go through a pool of
+    exactly one connection, so they are serialized in the process instead of
+    fighting over the database lock. A thread holding the writer keeps using
+    it for nested calls, reads included, so a @writes helper can call another
+    one (or read its own uncommitted rows) instead of waiting on itself.
+    """
+
+    def __init__(self, db_path=connection_pool.DB_PATH, readers=4, timeout=30.0):
+        self.db_path = db_path
+        self.writer = connection_pool.ConnectionPool(db_path, size=1, timeout=timeout)
+        # Opening the writer first makes the file WAL before any reader attaches
+        with self.writer.connection():
+            pass
+        read_uri = pathlib.Path(db_path).resolve().as_uri() + '?mode=ro'
+        self.readers = connection_pool.ConnectionPool(read_uri, size=readers, timeout=timeout,
+                                                      pragmas=READ_PRAGMAS,
+                                                      connect_kwargs={'uri': True})
+        self._held = threading.local()
+
+    @contextlib.contextmanager
+    def connection(self, role):
+        """Borrow from the 'readers' or 'writer' pool, reusing what this thread holds."""
+        held = getattr(self._held, 'writer', None)
+        if held is None and role == 'readers':
+            held = getattr(self._held, 'readers', None)
+        if held is not None:
+            yield held
+            return
+        with getattr(self, role).connection() as conn:
+            setattr(self._held, role, conn)
+            try:
+                yield conn
+            finally:
+                setattr(self._held, role, None)
+
+    def stats(self):
+        return {'readers': self.readers.stats(), 'writer': self.writer.stats()}
+
+    def close(self):
+        self.readers.close()
+        self.writer.close()
+
+
+_default_router = None
+_router_lock = threading.Lock()
+
+
+def get_default_router():
+    global _default_router
+    if _default_router is None:
+        with _router_lock:
+            if _default_router is None:
+                _default_router = ConnectionRouter()
+    return _default_router
+
+
+def _routed(func, router, role):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with (router or get_default_router()).connection(role) as conn:
+            return func(conn, *args, **kwargs)
+    return wrapper
+
+
+def read_only(func=None, *, router=None):
+    """with_db_connection for helpers that only read: uses a read-only connection."""
+    def decorator(func):
+        return _routed(func, router, 'readers')
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def writes(func=None, *, router=None):
+    """with_db_connection for helpers that write: uses the single writer connection."""
+    def decorator(func):
+        return _routed(func, router, 'writer')
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+@read_only
+def get_user_by_id(conn, user_id):
+    return conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+
+
+@writes
+def update_user_email(conn, user_id, new_email):
+    with conn:
+        conn.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        updates = [executor.submit(update_user_email, user_id, f"user{user_id}@example.com")
+                   for user_id in range(1, 51)]
+        users = list(executor.map(get_user_by_id, range(1, 201)))
+        for update in updates:
+            update.result()
+    print(len(users), get_default_router().stats())
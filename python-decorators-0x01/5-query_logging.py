@@ -0,0 +1,272 @@
+import re
+import sys
+import time
+import atexit
+import random
+import sqlite3
+import functools
+import threading
+from collections import deque
+from datetime import datetime
+
+
+class QueryLogger:
+    """
+    Buffered query logger flushed by a background thread.
+
+    Records are appended to a bounded deque, which is atomic under the GIL, so
+    the query path never takes a lock or touches the sink. When the buffer is
+    full the record is dropped and counted instead of blocking the caller.
+    """
+
+    def __init__(self, sink=None, capacity=10000, batch_size=500,
+                 flush_interval=0.5, sample_rate=1.0):
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rate = sample_rate
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self._buffer = deque()
+        self._owns_sink = isinstance(sink, str)
+        self._sink = open(sink, 'a') if self._owns_sink else (sink or sys.stdout)
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='query-logger', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def sampled(self):
+        """Decide whether the next query should be logged at all."""
+        if self.sample_rate >= 1.0 or random.random() < self.sample_rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+    def record(self, query, duration, rows):
+        if len(self._buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self._buffer.append((time.time(), query, duration, rows))
+
+    def flush(self):
+        """Write every buffered record to the sink in batches."""
+        with self._flush_lock:
+            buffer = self._buffer
+            while buffer:
+                lines = []
+                while buffer and len(lines) < self.batch_size:
+                    lines.append(self._format(buffer.popleft()))
+                self._sink.write(''.join(lines))
+                self.written += len(lines)
+            self._sink.flush()
+
+    def close(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join()
+        if self._owns_sink:
+            self._sink.close()
+
+    def _run(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    @staticmethod
+    def _format(record):
+        timestamp, query, duration, rows = record
+        rows = 'error' if rows is None else f"{rows} rows"
+        return (f"{datetime.fromtimestamp(timestamp)} - Executing query: {query} "
+                f"({duration * 1000:.3f} ms, {rows})\n")
+
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=4096)
+def fingerprint(query):
+    """Normalize a SQL string so queries differing only by literals match."""
+    normalized = _STRING.sub('?', query)
+    normalized = _NUMBER.sub('?', normalized)
+    normalized = _IN_LIST.sub('(?)', normalized)
+    return _WHITESPACE.sub(' ', normalized).strip().rstrip(';').rstrip()
+
+
+class _FingerprintStats:
+    __slots__ = ('calls', 'errors', 'total_time', 'max_time', 'rows', 'samples')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.samples = []
+
+
+class QueryStats:
+    """
+    Running per-fingerprint statistics, in the spirit of pg_stat_statements.
+
+    Durations are kept in a fixed-size reservoir per fingerprint so the
+    percentiles stay representative without growing with the call count.
+    """
+
+    def __init__(self, reservoir_size=1024):
+        self.reservoir_size = reservoir_size
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, query, duration, rows):
+        key = fingerprint(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _FingerprintStats()
+            entry.calls += 1
+            entry.total_time += duration
+            if duration > entry.max_time:
+                entry.max_time = duration
+            if rows is None:
+                entry.errors += 1
+            else:
+                entry.rows += rows
+            if len(entry.samples) < self.reservoir_size:
+                entry.samples.append(duration)
+            else:
+                slot = random.randrange(entry.calls)
+                if slot < self.reservoir_size:
+                    entry.samples[slot] = duration
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+
+    def top(self, n=10, by='total_time'):
+        """Return the n heaviest fingerprints as dicts, sorted by the given field."""
+        with self._lock:
+            snapshot = [(key, entry, sorted(entry.samples))
+                        for key, entry in self._entries.items()]
+        rows = []
+        for key, entry, samples in snapshot:
+            rows.append({
+                'query': key,
+                'calls': entry.calls,
+                'errors': entry.errors,
+                'total_time': entry.total_time,
+                'mean_time': entry.total_time / entry.calls,
+                'max_time': entry.max_time,
+                'p50': _percentile(samples, 50),
+                'p95': _percentile(samples, 95),
+                'p99': _percentile(samples, 99),
+                'rows': entry.rows,
+            })
+        rows.sort(key=lambda row: row[by], reverse=True)
+        return rows[:n]
+
+    def report(self, n=10, by='total_time', stream=None):
+        """Write a top-n table with times in milliseconds."""
+        stream = stream or sys.stdout
+        stream.write(f"{'calls':>8} {'total ms':>10} {'max ms':>9} {'p50':>8} "
+                     f"{'p95':>8} {'p99':>8} {'rows':>9}  query\n")
+        for row in self.top(n, by):
+            stream.write(f"{row['calls']:>8} {row['total_time'] * 1000:>10.2f} "
+                         f"{row['max_time'] * 1000:>9.3f} {row['p50'] * 1000:>8.3f} "
+                         f"{row['p95'] * 1000:>8.3f} {row['p99'] * 1000:>8.3f} "
+                         f"{row['rows']:>9}  {row['query']}\n")
+
+
+def _percentile(samples, percent):
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, int(round(percent / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+_default_logger = None
+
+
+def get_default_logger():
+    global _default_logger
+    if _default_logger is None:
+        _default_logger = QueryLogger()
+    return _default_logger
+
+
+def _row_count(result):
+    if isinstance(result, list):
+        return len(result)
+    return 0 if result is None else 1
+
+
+def _query_of(args, kwargs):
+    # Below with_db_connection or cache_query the connection comes first
+    return kwargs.get('query', next((arg for arg in args if isinstance(arg, str)),
+                                    "No query provided"))
+
+
+def log_queries(func=None, *, logger=None, stats=None):
+    """
+    Log each query with its duration and row count through a QueryLogger.
+
+    Passing a QueryStats switches to aggregate mode: every call is folded into
+    the per-fingerprint statistics and no log lines are written unless a
+    logger is given explicitly as well.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            active = logger
+            if active is None and stats is None:
+                active = get_default_logger()
+            log = active is not None and active.sampled()
+            if not log and stats is None:
+                return func(*args, **kwargs)
+            query = _query_of(args, kwargs)
+            rows = None
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                rows = _row_count(result)
+                return result
+            finally:
+                duration = time.perf_counter() - started
+                if log:
+                    active.record(query, duration, rows)
+                if stats is not None:
+                    stats.record(query, duration, rows)
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+@log_queries
+def fetch_all_users(query):
+    conn = sqlite3.connect('users.db')
+    cursor = conn.cursor()
+    cursor.execute(query)
+    results = cursor.fetchall()
+    conn.close()
+    return results
+
+
+# Example usage
+if __name__ == "__main__":
+    users = fetch_all_users(query="SELECT * FROM users")
+    get_default_logger().close()
+
+    # Aggregate mode: fold calls into per-fingerprint stats and print the top queries
+    stats = QueryStats()
+    fetch_user = log_queries(stats=stats)(fetch_all_users.__wrapped__)
+    for user_id in range(1, 6):
+        fetch_user(query=f"SELECT * FROM users WHERE id = {user_id}")
+    stats.report(n=5)
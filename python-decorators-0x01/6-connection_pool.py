@@ -0,0 +1,191 @@
+import time
+import queue
+import sqlite3
+import functools
+import threading
+import contextlib
+
+DB_PATH = 'users.db'
+
+# Applied once when a connection is opened, never per query
+DEFAULT_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),  # negative values are KiB, so ~16 MB
+    ('mmap_size', 268435456),
+)
+
+
+class PoolExhausted(Exception):
+    """Raised when no connection becomes free before the pool timeout."""
+
+
+class ConnectionPool:
+    """
+    Reusable sqlite3 connections for with_db_connection.
+
+    By default connections are shared through a bounded pool; callers wait up
+    to `timeout` seconds when all `size` connections are in use. With
+    thread_local=True every thread keeps one connection of its own instead.
+    Either way nested borrows in a thread share the connection it already
+    holds, so they never take a second slot, and only the outermost release
+    rolls back whatever transaction was left open.
+    connect_kwargs are passed on to sqlite3.connect (factory, cached_statements, ...).
+    """
+
+    def __init__(self, db_path=DB_PATH, size=5, timeout=5.0, thread_local=False,
+                 pragmas=DEFAULT_PRAGMAS, connect_kwargs=None):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.thread_local = thread_local
+        self.pragmas = tuple(pragmas)
+        self.connect_kwargs = dict(connect_kwargs or {})
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self._idle = queue.LifoQueue()  # LIFO hands out the most recently used, warmest connection
+        self._created = 0
+        self._opened = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, **self.connect_kwargs)
+        try:
+            for name, value in self.pragmas:
+                conn.execute(f"PRAGMA {name} = {value}")
+        except BaseException:
+            # e.g. "database is locked" while switching to WAL
+            conn.close()
+            raise
+        with self._lock:
+            self.misses += 1
+            self._opened.append(conn)
+        return conn
+
+    def acquire(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            # Nested borrow, or a thread-local connection: reuse what the thread holds
+            with self._lock:
+                self.hits += 1
+        elif self.thread_local:
+            conn = self._local.conn = self._connect()
+        else:
+            conn = self._local.conn = self._acquire_shared()
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        return conn
+
+    def _acquire_shared(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.size
+                if can_open:
+                    self._created += 1
+            if can_open:
+                try:
+                    return self._connect()
+                except BaseException:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            started = time.perf_counter()
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolExhausted(f"no connection to {self.db_path} free after {self.timeout}s")
+            finally:
+                with self._lock:
+                    self.waits += 1
+                    self.wait_time += time.perf_counter() - started
+        with self._lock:
+            self.hits += 1
+        return conn
+
+    def release(self, conn):
+        self._local.depth -= 1
+        if self._local.depth:
+            return  # an outer borrow in this thread still owns the connection and transaction
+        # Never hand the next caller a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        if not self.thread_local:
+            self._local.conn = None
+            self._idle.put(conn)
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'waits': self.waits,
+                'wait_time': self.wait_time,
+                'open': len(self._opened),
+                'idle': self._idle.qsize(),
+            }
+
+    def close(self):
+        with self._lock:
+            opened, self._opened = self._opened, []
+            self._created = 0
+        self._idle = queue.LifoQueue()
+        self._local = threading.local()
+        for conn in opened:
+            conn.close()
+
+
+_default_pool = None
+
+
+def get_default_pool():
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ConnectionPool()
+    return _default_pool
+
+
+def set_default_pool(pool):
+    """Replace the pool used by with_db_connection when none is given."""
+    global _default_pool
+    _default_pool = pool
+
+
+def with_db_connection(func=None, *, pool=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # Borrow a connection from the pool instead of opening a new one
+            with (pool or get_default_pool()).connection() as conn:
+                return func(conn, *args, **kwargs)
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+@with_db_connection
+def get_user_by_id(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+    return cursor.fetchone()
+
+
+# Fetch users by ID, reusing the same pooled connection
+if __name__ == "__main__":
+    for user_id in range(1, 4):
+        print(get_user_by_id(user_id=user_id))
+    print(get_default_pool().stats())
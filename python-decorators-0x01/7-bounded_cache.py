@@ -0,0 +1,455 @@
+import re
+import sys
+import zlib
+import sqlite3
+import time
+import pickle
+import functools
+import contextlib
+import threading
+from collections import OrderedDict
+from collections.abc import Sequence
+
+with_db_connection = __import__('6-connection_pool').with_db_connection
+
+_MISSING = object()
+
+_IDENTIFIER = r'[`"\[]?([\w.]+)[`"\]]?'
+_WRITE_TABLES = re.compile(
+    r'\b(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?'
+    r'|DELETE\s+FROM|(?:DROP|ALTER)\s+TABLE(?:\s+IF\s+EXISTS)?)\s+' + _IDENTIFIER,
+    re.IGNORECASE)
+
+
+def _table_names(pattern, sql):
+    return frozenset(name.rsplit('.', 1)[-1].lower() for name in pattern.findall(sql))
+
+
+def tables_written(sql):
+    """Names of the tables a statement modifies."""
+    return _table_names(_WRITE_TABLES, sql)
+
+
+# id(connection) -> the table sets of the recordings running on it, innermost last
+_recordings = {}
+_recordings_lock = threading.Lock()
+
+
+def _recorder(recordings):
+    def authorize(action, arg1, arg2, db_name, trigger):
+        # Views report the tables behind them too, and SQLite's own tables are not data
+        if action == sqlite3.SQLITE_READ and not arg1.startswith('sqlite_'):
+            for tables in recordings:
+                tables.add(arg1.lower())
+        return sqlite3.SQLITE_OK
+    return authorize
+
+
+def start_recording(conn):
+    """
+    (tables, authorizer): the set the tables read on conn are added to from
+    now on, and the authorizer to install on conn, or None when a recording
+    already running on it does. Pair with stop_recording().
+    """
+    tables = set()
+    with _recordings_lock:
+        recordings = _recordings.get(id(conn))
+        authorizer = None
+        if recordings is None:
+            recordings = _recordings[id(conn)] = []
+            authorizer = _recorder(recordings)
+        recordings.append(tables)
+    return tables, authorizer
+
+
+def stop_recording(conn, tables):
+    """Whether this was the last recording on conn, so its authorizer must go."""
+    with _recordings_lock:
+        recordings = _recordings[id(conn)]
+        del recordings[next(index for index, other in enumerate(recordings) if other is tables)]
+        if recordings:
+            return False
+        del _recordings[id(conn)]
+        return True
+
+
+@contextlib.contextmanager
+def record_reads(conn):
+    """
+    Collect the names of the tables statements prepared on conn read while
+    the block runs, as SQLite resolves them: comma joins, subqueries and the
+    tables behind views included. Recordings may nest on one connection.
+    """
+    tables, authorizer = start_recording(conn)
+    if authorizer is not None:
+        conn.set_authorizer(authorizer)
+    try:
+        yield tables
+    finally:
+        if stop_recording(conn, tables):
+            conn.set_authorizer(None)
+
+
+class PackedRows(Sequence):
+    """
+    Result rows pickled into fixed-size chunks, optionally zlib-compressed.
+
+    Iteration decodes one chunk at a time, so the full list of tuples is never
+    rebuilt unless the caller asks for it with list().
+    """
+
+    __slots__ = ('_chunks', '_length', '_chunk_rows', '_compressed')
+
+    def __init__(self, rows, chunk_rows=256, compress=False, level=1):
+        rows = list(rows)
+        self._length = len(rows)
+        self._chunk_rows = chunk_rows
+        self._compressed = compress
+        self._chunks = []
+        for start in range(0, len(rows), chunk_rows):
+            chunk = pickle.dumps(rows[start:start + chunk_rows], protocol=pickle.HIGHEST_PROTOCOL)
+            self._chunks.append(zlib.compress(chunk, level) if compress else chunk)
+
+    def _decode(self, chunk):
+        return pickle.loads(zlib.decompress(chunk) if self._compressed else chunk)
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from self._decode(chunk)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("PackedRows index out of range")
+        chunk = self._decode(self._chunks[index // self._chunk_rows])
+        return chunk[index % self._chunk_rows]
+
+    def __eq__(self, other):
+        if isinstance(other, (PackedRows, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"<PackedRows rows={self._length} bytes={self.nbytes}>"
+
+    @property
+    def nbytes(self):
+        """Memory actually held by the packed buffers and their containers."""
+        return (sys.getsizeof(self) + sys.getsizeof(self._chunks)
+                + sum(sys.getsizeof(chunk) for chunk in self._chunks))
+
+
+def result_size(result):
+    """Estimate the memory held by a fetchall() style result, in bytes."""
+    if isinstance(result, PackedRows):
+        return result.nbytes
+    size = sys.getsizeof(result)
+    if isinstance(result, (list, tuple)):
+        for row in result:
+            size += sys.getsizeof(row)
+            if isinstance(row, (list, tuple)):
+                size += sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def make_key(query, args=(), kwargs=None):
+    """Build the cache key from the query and all of its parameters."""
+    return (query, _freeze(args), _freeze(kwargs or {}))
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'expires', 'tables', 'hits')
+
+    def __init__(self, value, size, expires, tables):
+        self.value = value
+        self.size = size
+        self.expires = expires
+        self.tables = tables
+        self.hits = 0
+
+
+class QueryCache:
+    """
+    Bounded cache for query results.
+
+    With policy='lru' a hit moves the entry to the back of the eviction order;
+    with policy='ttl' entries keep their insertion order and mainly leave once
+    they expire. Either way the cache never holds more than max_entries results
+    or more than max_bytes of estimated row memory.
+
+    Entries are tagged with the tables their query reads, as recorded by
+    record_reads(), and invalidate_tables() evicts every entry tagged with a
+    modified table. Each table also carries a generation number so a read
+    that started before a write cannot store its now stale result after the
+    invalidation.
+
+    With compact=True list results are stored as PackedRows (compressed too
+    when compress=True), trading a decode on each hit for several times more
+    entries in the same max_bytes. cache_query then returns PackedRows on
+    misses too, so callers see one result type; use list() to get a list.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=None, policy='lru',
+                 compact=False, compress=False, chunk_rows=256):
+        if policy not in ('lru', 'ttl'):
+            raise ValueError(f"unknown eviction policy: {policy}")
+        if policy == 'ttl' and ttl is None:
+            raise ValueError("policy='ttl' needs a ttl")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.policy = policy
+        self.compact = compact
+        self.compress = compress
+        self.chunk_rows = chunk_rows
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            if self.policy == 'lru':
+                self._entries.move_to_end(key)
+            entry.hits += 1
+            self.hits += 1
+            return entry.value
+
+    def generation(self, tables):
+        """Snapshot of the write generations of the given tables."""
+        with self._lock:
+            return tuple(self._generations.get(table, 0) for table in sorted(tables))
+
+    def generations(self):
+        """Snapshot of the write generations of every table written so far."""
+        with self._lock:
+            return dict(self._generations)
+
+    def pack(self, value):
+        """value in the form hits return it: PackedRows for lists when compact."""
+        if self.compact and isinstance(value, list):
+            return PackedRows(value, self.chunk_rows, self.compress)
+        return value
+
+    def put(self, key, value, tables=frozenset(), generation=None, ttl=None):
+        value = self.pack(value)
+        size = result_size(value)
+        if size > self.max_bytes:
+            return False
+        ttl = ttl if ttl is not None else self.ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            if generation is not None and generation != tuple(
+                    self._generations.get(table, 0) for table in sorted(tables)):
+                # A write committed while the query ran; its result may be stale
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, size, expires, tables)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def hottest(self, n=None):
+        """
+        Live entries as (key, value, tables, remaining_ttl, hits) tuples, most
+        hit first; remaining_ttl is None for entries that never expire.
+        """
+        now = time.monotonic()
+        with self._lock:
+            items = [(key, entry.value, entry.tables,
+                      None if entry.expires is None else entry.expires - now, entry.hits)
+                     for key, entry in self._entries.items()
+                     if entry.expires is None or entry.expires > now]
+        items.sort(key=lambda item: item[4], reverse=True)
+        return items if n is None else items[:n]
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate_tables(self, tables):
+        """Evict every entry that read one of the given tables."""
+        with self._lock:
+            for table in tables:
+                table = table.lower()
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in self._by_table.pop(table, ()):
+                    if key in self._entries:
+                        self._remove(key)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.bytes -= entry.size
+        for table in entry.tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'version')
+
+    def __init__(self, version):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.version = version
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls for the same key into a single execution.
+
+    The first caller runs the function; callers arriving while it is in flight
+    wait for it and get the same result, or the same exception. Callers pass
+    the version of the data they must see (e.g. table generations): one that
+    arrives with a different version than the running call started from, say
+    right after its own write, runs fn itself instead of taking a stale result.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, version=None):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and call.version != version:
+                call = None
+                leader = False
+            else:
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call(version)
+                else:
+                    self.coalesced += 1
+        if call is None:
+            return fn()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+
+query_cache = QueryCache()
+query_flight = SingleFlight()
+
+
+def cache_query(func=None, *, cache=None, single_flight=True):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(conn, query, *args, **kwargs):
+            active = cache if cache is not None else query_cache
+            key = make_key(query, args, kwargs)
+            result = active.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+            # Which tables the query reads is only known once SQLite has prepared it,
+            # so snapshot every generation now and pick the relevant ones afterwards
+            before = active.generations()
+
+            def load():
+                # Execute function and cache the result, shaped as hits return it
+                with record_reads(conn) as tables:
+                    result = active.pack(func(conn, query, *args, **kwargs))
+                generation = tuple(before.get(table, 0) for table in sorted(tables))
+                active.put(key, result, frozenset(tables), generation)
+                return result
+
+            if single_flight:
+                # Cold key: concurrent identical queries of this function and cache
+                # wait for the first one, unless a write landed since it started
+                return query_flight.do((active, func, key), load, tuple(sorted(before.items())))
+            return load()
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+@with_db_connection
+@cache_query
+def fetch_users_with_cache(conn, query, params=()):
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    return cursor.fetchall()
+
+
+if __name__ == "__main__":
+    # Same query text with different parameters gets its own entry
+    older = fetch_users_with_cache(query="SELECT * FROM users WHERE age > ?", params=(40,))
+    younger = fetch_users_with_cache(query="SELECT * FROM users WHERE age > ?", params=(60,))
+    older_again = fetch_users_with_cache(query="SELECT * FROM users WHERE age > ?", params=(40,))
+    print(query_cache.stats())
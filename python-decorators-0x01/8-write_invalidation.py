@@ -0,0 +1,69 @@
+import functools
+import contextlib
+
+with_db_connection = __import__('6-connection_pool').with_db_connection
+bounded_cache = __import__('7-bounded_cache')
+
+
+@contextlib.contextmanager
+def track_writes(conn):
+    """
+    Collect the tables modified by every statement run on conn in the block.
+
+    Uses the sqlite3 trace callback, so writes issued through any cursor are
+    seen; the callback is removed again when the block exits.
+    """
+    written = set()
+
+    def trace(statement):
+        written.update(bounded_cache.tables_written(statement))
+
+    conn.set_trace_callback(trace)
+    try:
+        yield written
+    finally:
+        conn.set_trace_callback(None)
+
+
+def transactional(func=None, *, cache=None):
+    """
+    Run the function in a transaction and, once it commits, evict the cached
+    results of every query that read one of the tables it modified.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(conn, *args, **kwargs):
+            with track_writes(conn) as written:
+                try:
+                    # Begin transaction
+                    conn.execute("BEGIN TRANSACTION")
+                    result = func(conn, *args, **kwargs)
+                    conn.commit()
+                except Exception:
+                    # Rollback transaction on error; nothing changed, nothing to evict
+                    conn.rollback()
+                    raise
+            if written:
+                (cache if cache is not None else bounded_cache.query_cache).invalidate_tables(written)
+            return result
+        return wrapper
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+@with_db_connection
+@transactional
+def update_user_email(conn, user_id, new_email):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE users SET email = ? WHERE id = ?", (new_email, user_id))
+
+
+if __name__ == "__main__":
+    fetch_users_with_cache = bounded_cache.fetch_users_with_cache
+    before = fetch_users_with_cache(query="SELECT * FROM users WHERE id = ?", params=(1,))
+    update_user_email(user_id=1, new_email='Crawford_Cartwright@hotmail.com')
+    # The update evicted the cached row, so this read goes back to the database
+    after = fetch_users_with_cache(query="SELECT * FROM users WHERE id = ?", params=(1,))
+    print(before, after)
+    print(bounded_cache.query_cache.stats())
@@ -0,0 +1,266 @@
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+import multiprocessing
+
+bounded_cache = __import__('7-bounded_cache')
+
+CACHE_PATH = 'query_cache.db'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key BLOB PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE TABLE IF NOT EXISTS entry_tables (
+    table_name TEXT NOT NULL,
+    key BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entry_tables_name ON entry_tables (table_name);
+CREATE INDEX IF NOT EXISTS entry_tables_key ON entry_tables (key);
+CREATE TABLE IF NOT EXISTS generations (
+    table_name TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+"""
+
+
+def _digest(key):
+    return hashlib.blake2b(pickle.dumps(key, protocol=pickle.HIGHEST_PROTOCOL),
+                           digest_size=16).digest()
+
+
+class SharedQueryCache:
+    """
+    Query cache shared by every process on the host through a SQLite file.
+
+    Drop-in replacement for QueryCache: results are pickled into the file,
+    evicted least recently used once max_entries or max_bytes is exceeded, and
+    expire after ttl seconds. Table tags and write generations live in the
+    file too, so a commit in one worker invalidates the entries of all others.
+    Hit and miss counters are per process; entries and bytes are global.
+
+    The file already outlives the workers, so there is nothing to snapshot:
+    only hashes of the keys are stored and there is no hottest(). put()
+    still takes ttl=, so a QueryCache snapshot can be restored into it.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=10000, max_bytes=256 * 1024 * 1024,
+                 ttl=None, touch_interval=1.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # last_used is only rewritten when older than this, so hits stay read-only
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        # Connections must not cross threads or survive a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key, default=None):
+        digest = _digest(key)
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires, last_used FROM entries WHERE key = ?", (digest,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] <= now):
+            self._count('misses')
+            return default
+        if now - row[2] > self.touch_interval:
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, digest))
+        self._count('hits')
+        return pickle.loads(row[0])
+
+    def generation(self, tables):
+        tables = sorted(tables)
+        if not tables:
+            return ()
+        rows = dict(self._conn().execute(
+            f"SELECT table_name, generation FROM generations "
+            f"WHERE table_name IN ({', '.join('?' * len(tables))})", tables
+        ).fetchall())
+        return tuple(rows.get(table, 0) for table in tables)
+
+    def generations(self):
+        return dict(self._conn().execute(
+            "SELECT table_name, generation FROM generations").fetchall())
+
+    def pack(self, value):
+        # Hits are unpickled into the type that was stored, so nothing to reshape
+        return value
+
+    def put(self, key, value, tables=frozenset(), generation=None, ttl=None):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(payload) > self.max_bytes:
+            return False
+        digest = _digest(key)
+        now = time.time()
+        ttl = ttl if ttl is not None else self.ttl
+        expires = now + ttl if ttl is not None else None
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if generation is not None and generation != self.generation(tables):
+                # A write committed while the query ran; its result may be stale
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("DELETE FROM entry_tables WHERE key = ?", (digest,))
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, expires, last_used) "
+                "VALUES (?, ?, ?, ?, ?)", (digest, payload, len(payload), expires, now))
+            conn.executemany("INSERT INTO entry_tables (table_name, key) VALUES (?, ?)",
+                             [(table, digest) for table in tables])
+            self._evict(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM entry_tables WHERE key IN "
+                     "(SELECT key FROM entries WHERE expires <= ?)", (now,))
+        conn.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        victims = []
+        for digest, size in conn.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            victims.append((digest,))
+            count -= 1
+            total -= size
+        conn.executemany("DELETE FROM entry_tables WHERE key = ?", victims)
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        with self._lock:
+            self.evictions += len(victims)
+
+    def invalidate(self, key):
+        digest = _digest(key)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM entry_tables WHERE key = ?", (digest,))
+            conn.execute("DELETE FROM entries WHERE key = ?", (digest,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def invalidate_tables(self, tables):
+        tables = [table.lower() for table in tables]
+        if not tables:
+            return
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO generations (table_name, generation) VALUES (?, 1) "
+                "ON CONFLICT (table_name) DO UPDATE SET generation = generation + 1",
+                [(table,) for table in tables])
+            placeholders = ', '.join('?' * len(tables))
+            conn.execute(f"DELETE FROM entries WHERE key IN (SELECT key FROM entry_tables "
+                         f"WHERE table_name IN ({placeholders}))", tables)
+            conn.execute("DELETE FROM entry_tables WHERE key NOT IN (SELECT key FROM entries)")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM entry_tables")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self):
+        count, total = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': count,
+                'bytes': total,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+
+def _benchmark_worker(args):
+    shared, cache_path, db_path, queries, rounds = args
+    cache = SharedQueryCache(cache_path) if shared else bounded_cache.QueryCache()
+    executed = 0
+
+    @bounded_cache.cache_query(cache=cache)
+    def fetch(conn, query, params=()):
+        nonlocal executed
+        executed += 1
+        return conn.execute(query, params).fetchall()
+
+    conn = sqlite3.connect(db_path)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for query, params in queries:
+            fetch(conn, query, params)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return executed, elapsed
+
+
+def benchmark(workers=4, rounds=20, db_path='users.db', cache_path='benchmark_cache.db'):
+    """Compare per-process QueryCache with SharedQueryCache across worker processes."""
+    queries = [("SELECT * FROM users WHERE age > ?", (age,)) for age in range(20, 70, 5)]
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(cache_path + suffix):
+            os.remove(cache_path + suffix)
+    SharedQueryCache(cache_path)  # create the schema before the workers race for it
+    for shared in (False, True):
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_benchmark_worker,
+                               [(shared, cache_path, db_path, queries, rounds)] * workers)
+        executed = sum(count for count, _ in results)
+        slowest = max(elapsed for _, elapsed in results)
+        name = 'shared sqlite file' if shared else 'per-process dict'
+        print(f"{name:>20}: {executed:>4} queries executed, "
+              f"{workers * rounds * len(queries)} lookups, slowest worker {slowest * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -1,8 +1,20 @@
 import mysql.connector
 from mysql.connector import Error
+from instrumentation import instrumented
 
-def stream_users():
-    """Generator to stream rows from user_data table one by one as dictionaries."""
+def _row_to_dict(row):
+    return {
+        'user_id': row[0],
+        'name': row[1],
+        'email': row[2],
+        'age': row[3]
+    }
+
+def stream_users(instrument=None):
+    """Generator to stream rows from user_data table one by one as dictionaries.
+
+    Pass an instrumentation.BatchInstrument to time every row as a batch of one.
+    """
     try:
         # Connect to the ALX_prodev database
         connection = mysql.connector.connect(
@@ -14,18 +26,21 @@ def stream_users():
         if connection.is_connected():
             cursor = connection.cursor()
             cursor.execute("SELECT user_id, name, email, age FROM user_data;")
+            if instrument is not None:
+                yield from instrumented(
+                    'stream_users',
+                    lambda: cursor.fetchmany(1),
+                    lambda rows: _row_to_dict(rows[0]),
+                    instrument
+                )
+                return
             # Single loop to fetch and yield rows
             while True:
                 row = cursor.fetchone()
                 if row is None:
                     break
                 # Yield row as a dictionary
-                yield {
-                    'user_id': row[0],
-                    'name': row[1],
-                    'email': row[2],
-                    'age': row[3]
-                }
+                yield _row_to_dict(row)
     except Error as e:
         print(f"Error streaming rows: {e}")
     finally:
@@ -1,8 +1,19 @@
 import mysql.connector
 from mysql.connector import Error
+from instrumentation import instrumented
 
-def stream_users_in_batches(batch_size):
-    """Generator to fetch rows from user_data table in batches."""
+def _rows_to_dicts(rows):
+    return [
+        {'user_id': row[0], 'name': row[1], 'email': row[2], 'age': row[3]}
+        for row in rows
+    ]
+
+def stream_users_in_batches(batch_size, instrument=None):
+    """Generator to fetch rows from user_data table in batches.
+
+    Pass an instrumentation.BatchInstrument to time fetch, decode and consumer
+    time of every batch.
+    """
     try:
         # Connect to the ALX_prodev database
         connection = mysql.connector.connect(
@@ -14,16 +25,21 @@ def stream_users_in_batches(batch_size):
         if connection.is_connected():
             cursor = connection.cursor()
             cursor.execute("SELECT user_id, name, email, age FROM user_data;")
+            if instrument is not None:
+                yield from instrumented(
+                    'stream_users_in_batches',
+                    lambda: cursor.fetchmany(batch_size),
+                    _rows_to_dicts,
+                    instrument
+                )
+                return
             # Loop 1: Fetch batches
             while True:
                 rows = cursor.fetchmany(batch_size)
                 if not rows:
                     break
                 # Yield the batch as a list of dictionaries
-                yield [
-                    {'user_id': row[0], 'name': row[1], 'email': row[2], 'age': row[3]}
-                    for row in rows
-                ]
+                yield _rows_to_dicts(rows)
     except Error as e:
         print(f"Error fetching batches: {e}")
     finally:
@@ -31,10 +47,10 @@ def stream_users_in_batches(batch_size):
             cursor.close()
             connection.close()
 
-def batch_processing(batch_size):
+def batch_processing(batch_size, instrument=None):
     """Generator to process batches and yield users over 25."""
     # Loop 2: Iterate over batches
-    for batch in stream_users_in_batches(batch_size):
+    for batch in stream_users_in_batches(batch_size, instrument):
         # Loop 3: Process each user in the batch
         for user in batch:
             if user['age'] > 25:
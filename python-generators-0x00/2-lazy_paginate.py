@@ -1,8 +1,18 @@
 from seed import paginate_users
+from instrumentation import instrumented
 
-def lazy_paginate(page_size):
+def lazy_paginate(page_size, instrument=None):
     """Generator to lazily load paginated data from user_data table."""
     offset = 0
+    if instrument is not None:
+        def fetch_page():
+            nonlocal offset
+            page = paginate_users(page_size, offset)
+            offset += page_size
+            return page
+        # Pages already arrive as dictionaries, so there is nothing to decode
+        yield from instrumented('lazy_paginate', fetch_page, lambda page: page, instrument)
+        return
     # Single loop to fetch pages
     while True:
         page = paginate_users(page_size, offset)
@@ -1,8 +1,18 @@
 from seed import paginate_users
+from instrumentation import instrumented
 
-def lazy_pagination(page_size):  # Renamed to match 3-main.py
+def lazy_pagination(page_size, instrument=None):  # Renamed to match 3-main.py
     """Generator to lazily load paginated data from user_data table."""
     offset = 0
+    if instrument is not None:
+        def fetch_page():
+            nonlocal offset
+            page = paginate_users(page_size, offset)
+            offset += page_size
+            return page
+        # Pages already arrive as dictionaries, so there is nothing to decode
+        yield from instrumented('lazy_pagination', fetch_page, lambda page: page, instrument)
+        return
     # Single loop to fetch pages
     while True:
         page = paginate_users(page_size, offset)
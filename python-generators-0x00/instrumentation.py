@@ -0,0 +1,118 @@
+# instrumentation.py
+import bisect
+import time
+
+# Upper bounds (in seconds) of the histogram buckets; anything slower lands in "+inf"
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in seconds."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def summary(self):
+        labels = [f"<={bound}" for bound in self.buckets] + ["+inf"]
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+
+class BatchInstrument:
+    """
+    Collects per-batch timings from the streaming generators.
+    Fetch time is spent waiting on the database, decode time building the
+    yielded rows, and suspended time inside the consumer between two batches.
+    The optional hook is called with a dict describing every batch.
+    """
+
+    def __init__(self, hook=None, buckets=DEFAULT_BUCKETS):
+        self.hook = hook
+        self.fetch = Histogram(buckets)
+        self.decode = Histogram(buckets)
+        self.suspended = Histogram(buckets)
+        self.batches = 0
+        self.rows = 0
+        self.bytes = 0
+
+    def record(self, source, fetch, decode, suspended, rows, nbytes):
+        self.batches += 1
+        self.rows += rows
+        self.bytes += nbytes
+        self.fetch.observe(fetch)
+        self.decode.observe(decode)
+        self.suspended.observe(suspended)
+        if self.hook is not None:
+            self.hook({
+                'source': source,
+                'batch': self.batches,
+                'fetch': fetch,
+                'decode': decode,
+                'suspended': suspended,
+                'rows': rows,
+                'bytes': nbytes,
+            })
+
+    def summary(self):
+        return {
+            'batches': self.batches,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'fetch': self.fetch.summary(),
+            'decode': self.decode.summary(),
+            'suspended': self.suspended.summary(),
+        }
+
+
+def payload_size(rows):
+    """Approximate the wire size of a batch by the length of its values."""
+    total = 0
+    for row in rows:
+        values = row.values() if isinstance(row, dict) else row
+        for value in values:
+            if value is None:
+                continue
+            if isinstance(value, (str, bytes, bytearray)):
+                total += len(value)
+            else:
+                total += len(str(value))
+    return total
+
+
+def instrumented(source, fetch, decode, instrument):
+    """
+    Generator driving fetch() and decode() until fetch() returns no rows,
+    timing every stage of each batch and reporting it to the instrument.
+    The batch is recorded when the consumer resumes, or when it closes the
+    generator early, so the suspended time is always accounted for.
+    """
+    clock = time.perf_counter
+    while True:
+        started = clock()
+        rows = fetch()
+        fetched = clock()
+        if not rows:
+            break
+        batch = decode(rows)
+        decoded = clock()
+        try:
+            yield batch
+        finally:
+            instrument.record(source, fetched - started, decoded - fetched,
+                              clock() - decoded, len(rows), payload_size(rows))